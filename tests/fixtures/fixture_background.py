@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def sync_background_tasks(settings):
+    """Миниатюры и варианты картинок создаются сразу, а не в потоке,
+    который переживет временный MEDIA_ROOT теста."""
+    settings.THUMBNAIL_ASYNC = False
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def strict_query_budget(settings):
+    """Превышение QUERY_BUDGETS в запросе теста роняет тест."""
+    settings.QUERY_BUDGET_RAISE = True
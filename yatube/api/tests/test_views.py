@@ -0,0 +1,110 @@
+import json
+
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+# Лента подписок заполняется сразу, а не после коммита
+@override_settings(THUMBNAIL_ASYNC=False)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest = Client()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+        cls.group = Group.objects.create(
+            title='Группа', slug='api', description='Описание')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.author, group=cls.group)
+            for i in range(15)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def get(self, url, client=None, **params):
+        response = (client or ApiTests.guest).get(url, params)
+        content = b''.join(response.streaming_content) if (
+            response.streaming) else response.content
+        return response, json.loads(content)
+
+    def test_feeds_paginate_by_cursor(self):
+        '''Ленты отдаются страницами по курсору'''
+        urls = {
+            reverse('api:v1:index'): None,
+            reverse('api:v1:group_list', args=('api',)): None,
+            reverse('api:v1:profile', args=('author',)): None,
+            reverse('api:v1:follow_index'): ApiTests.reader_client,
+        }
+        expected = [post.pk for post in reversed(ApiTests.posts)]
+        for url, client in urls.items():
+            with self.subTest(url=url):
+                _, first = self.get(url, client, limit=10)
+                _, second = self.get(url, client, after=first['next'])
+                ids = [item['id'] for item in first['results']]
+                ids += [item['id'] for item in second['results']]
+                self.assertEqual(ids, expected)
+                self.assertIsNone(second['next'])
+
+    def test_fields_selection(self):
+        '''Клиент выбирает поля ответа'''
+        _, data = self.get(reverse('api:v1:index'), fields='id,author')
+        self.assertEqual(
+            data['results'][0],
+            {'id': ApiTests.posts[-1].pk, 'author': 'author'}
+        )
+        response, _ = self.get(reverse('api:v1:index'), fields='password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_detail(self):
+        '''Пост отдается вместе с комментариями'''
+        _, data = self.get(
+            reverse('api:v1:post_detail', args=(ApiTests.posts[0].pk,)))
+        self.assertEqual(data['group'], 'api')
+        self.assertEqual(data['comments'][0]['text'], 'Комментарий')
+        self.assertIsNone(data['comments_next'])
+
+    @override_settings(API_COMMENTS_LIMIT=2)
+    def test_post_detail_comments_capped(self):
+        '''В пост встраиваются первые комментарии, остальные по курсору'''
+        post = ApiTests.posts[1]
+        for i in range(3):
+            Comment.objects.create(
+                post=post, author=ApiTests.reader, text=f'Ответ {i}')
+        _, data = self.get(reverse('api:v1:post_detail', args=(post.pk,)))
+        self.assertEqual(
+            [comment['text'] for comment in data['comments']],
+            ['Ответ 2', 'Ответ 1']
+        )
+        response, page = self.get(data['comments_next'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [comment['text'] for comment in page['results']], ['Ответ 0'])
+        self.assertIsNone(page['next'])
+
+    def test_errors(self):
+        '''Неизвестные объекты, битый курсор и лента без входа'''
+        cases = {
+            (reverse('api:v1:group_list', args=('missing',)), ''): 404,
+            (reverse('api:v1:profile', args=('missing',)), ''): 404,
+            (reverse('api:v1:post_detail', args=(0,)), ''): 404,
+            (reverse('api:v1:post_comments', args=(0,)), ''): 404,
+            (reverse('api:v1:index'), 'broken'): 400,
+            (reverse('api:v1:follow_index'), ''): 401,
+        }
+        for (url, after), status in cases.items():
+            with self.subTest(url=url):
+                params = {'after': after} if after else {}
+                response, _ = self.get(url, **params)
+                self.assertEqual(response.status_code, status)
+
+    def test_feed_in_one_query(self):
+        '''Страница ленты - один запрос к базе'''
+        with self.assertNumQueries(1):
+            self.get(reverse('api:v1:index'))
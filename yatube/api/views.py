@@ -0,0 +1,247 @@
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from posts.inbox import fan_in_authors, follow_feed
+from posts.models import Comment, FeedItem, Group, Post, User
+from posts.pagination import (CursorPaginator, after_position,
+                              decode_cursor, encode_position)
+
+# Поле ответа -> путь для values_list
+POST_FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = {
+    'id': 'pk',
+    'author': 'author__username',
+    'text': 'text',
+    'created': 'created',
+}
+
+encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+
+class BadRequest(Exception):
+    pass
+
+
+def error(message, status=400):
+    return JsonResponse({'detail': message}, status=status)
+
+
+def requested_fields(request):
+    """Поля из ``?fields=id,text``; по умолчанию все."""
+    names = [
+        name for name in request.GET.get('fields', '').split(',') if name
+    ] or list(POST_FIELDS)
+    unknown = [name for name in names if name not in POST_FIELDS]
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(unknown)}')
+    return names
+
+
+def requested_limit(request):
+    try:
+        limit = int(request.GET.get('limit', settings.PAGES_NUMBER))
+    except ValueError:
+        raise BadRequest('limit должен быть числом')
+    return min(max(limit, 1), settings.API_MAX_LIMIT)
+
+
+def requested_position(request):
+    token = request.GET.get('after')
+    if not token:
+        return None
+    position = decode_cursor(token)
+    if position is None:
+        raise BadRequest('Неверный курсор')
+    return position
+
+
+def post_rows(queryset, names):
+    """Кортежи values_list с выбранными полями; последние два
+    значения строки - created и id для курсора."""
+    paths = [POST_FIELDS[name] for name in names] + ['created', 'pk']
+    return queryset.values_list(*paths)
+
+
+def row_item(names, row):
+    item = dict(zip(names, row))
+    if 'image' in item:
+        item['image'] = (
+            default_storage.url(item['image']) if item['image'] else None
+        )
+    return item
+
+
+def stream_page(names, rows, next_cursor):
+    """Страница JSON по частям: строка за строкой, без общего словаря."""
+    yield '{"results": ['
+    for number, row in enumerate(rows):
+        yield (', ' if number else '') + encoder.encode(row_item(names, row))
+    yield '], "next": ' + json.dumps(next_cursor) + '}'
+
+
+def page_rows(queryset, names, limit, position):
+    """До ``limit + 1`` строк ленты после позиции курсора."""
+    queryset = queryset.order_by(*CursorPaginator.ordering)
+    if position is not None:
+        queryset = after_position(queryset, position)
+    # Строки забираются сразу, чтобы запрос прошел внутри view
+    # (бюджет запросов, обработка ошибок); потоком идет сериализация.
+    return list(post_rows(queryset, names)[:limit + 1])
+
+
+def comment_rows(post_id, limit, position=None):
+    """До ``limit + 1`` комментариев поста, новые первыми; последние
+    два значения строки - created и id для курсора."""
+    queryset = Comment.objects.filter(post_id=post_id).order_by(
+        *CursorPaginator.ordering
+    )
+    if position is not None:
+        queryset = after_position(queryset, position)
+    return list(queryset.values_list(
+        *COMMENT_FIELDS.values(), 'created', 'pk'
+    )[:limit + 1])
+
+
+def paged(rows, names, limit):
+    """Ответ со страницей; ``rows`` - до ``limit + 1`` строк, у которых
+    последние значения - позиция курсора (created, id)."""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_position(*rows[-1][-2:])
+    return stream_response(names, rows, next_cursor)
+
+
+def stream_response(names, rows, next_cursor):
+    return StreamingHttpResponse(
+        stream_page(names, rows, next_cursor),
+        content_type='application/json'
+    )
+
+
+def api_view(view):
+    """Переводит ошибки параметров в ответ 400."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as exc:
+            return error(str(exc))
+    return wrapper
+
+
+def feed(request, queryset, exists=None):
+    names = requested_fields(request)
+    limit = requested_limit(request)
+    position = requested_position(request)
+    rows = page_rows(queryset, names, limit, position)
+    # Группа или автор проверяются, только если лента пуста
+    if not rows and position is None and exists and not exists():
+        return error('Не найдено', 404)
+    return paged(rows, names, limit)
+
+
+@api_view
+def index(request):
+    return feed(request, Post.objects.all())
+
+
+@api_view
+def group_list(request, slug):
+    return feed(
+        request, Post.objects.filter(group__slug=slug),
+        Group.objects.filter(slug=slug).exists
+    )
+
+
+@api_view
+def profile(request, username):
+    return feed(
+        request, Post.objects.filter(author__username=username),
+        User.objects.filter(username=username).exists
+    )
+
+
+@api_view
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return error('Требуется вход', 401)
+    fan_in = fan_in_authors(request.user.pk)
+    if fan_in:
+        return feed(request, follow_feed(request.user.pk, fan_in))
+    names = requested_fields(request)
+    limit = requested_limit(request)
+    items = FeedItem.objects.filter(user=request.user).order_by(
+        *CursorPaginator.ordering
+    )
+    position = requested_position(request)
+    if position is not None:
+        items = after_position(items, position)
+    items = list(items.values_list('post_id', 'created', 'pk')[:limit + 1])
+    has_next = len(items) > limit
+    items = items[:limit]
+    posts = {
+        row[-1]: row for row in post_rows(
+            Post.objects.filter(pk__in=[item[0] for item in items]), names
+        )
+    }
+    rows = [
+        posts[post_id] for post_id, _, _ in items if post_id in posts
+    ]
+    # Курсор ленты подписок - позиция записи FeedItem, а не поста
+    next_cursor = encode_position(*items[-1][1:]) if has_next else None
+    return stream_response(names, rows, next_cursor)
+
+
+@api_view
+def post_detail(request, post_id):
+    names = requested_fields(request)
+    row = post_rows(Post.objects.filter(pk=post_id), names).first()
+    if row is None:
+        return error('Не найдено', 404)
+    data = row_item(names, row)
+    # Встраивается только начало обсуждения: остальное - по курсору
+    limit = settings.API_COMMENTS_LIMIT
+    comments = comment_rows(post_id, limit)
+    data['comments'] = [
+        dict(zip(COMMENT_FIELDS, comment)) for comment in comments[:limit]
+    ]
+    data['comments_next'] = None
+    if len(comments) > limit:
+        cursor = encode_position(*comments[limit - 1][-2:])
+        data['comments_next'] = '{}?{}'.format(
+            reverse('api:v1:post_comments', args=(post_id,)),
+            urlencode({'after': cursor})
+        )
+    return JsonResponse(
+        data, encoder=DjangoJSONEncoder, json_dumps_params={
+            'ensure_ascii': False
+        }
+    )
+
+
+@api_view
+def post_comments(request, post_id):
+    limit = requested_limit(request)
+    position = requested_position(request)
+    rows = comment_rows(post_id, limit, position)
+    if not rows and position is None and not Post.objects.filter(
+        pk=post_id
+    ).exists():
+        return error('Не найдено', 404)
+    return paged(rows, list(COMMENT_FIELDS), limit)
@@ -0,0 +1,195 @@
+import gc
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+from django.template.backends.django import Template
+
+from .query_budget import QueryRecorder
+
+# Метрики, по которым результат сравнивается с эталоном. Время
+# зависит от машины и шума, поэтому сравнивается с допуском;
+# число запросов и строк детерминировано и не должно расти вовсе.
+TIMED_METRICS = ('p50_ms', 'p95_ms', 'template_ms')
+COUNTED_METRICS = ('queries', 'rows')
+# Хвост распределения шумнее медианы: для p95 допуск и запас больше
+TAIL_FACTOR = 2
+# Разница меньше этой не считается регрессией даже сверх допуска:
+# у страниц в пару миллисекунд проценты - это шум таймера.
+MIN_SLACK_MS = 2.0
+
+
+class RowCounter:
+    """Считает строки, которые код забрал из курсоров БД."""
+
+    def __init__(self):
+        self.rows = 0
+
+
+class RowCountingCursor(CursorWrapper):
+    # fetch* у CursorWrapper отдаются через __getattr__ с переводом
+    # ошибок драйвера, поэтому берутся оттуда же.
+    def __init__(self, cursor, db, counter):
+        super().__init__(cursor, db)
+        self.counter = counter
+
+    def fetchone(self):
+        row = super().__getattr__('fetchone')()
+        if row is not None:
+            self.counter.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().__getattr__('fetchmany')(*args, **kwargs)
+        self.counter.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().__getattr__('fetchall')()
+        self.counter.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in super().__iter__():
+            self.counter.rows += 1
+            yield row
+
+
+@contextmanager
+def count_rows():
+    """Подменяет курсоры соединения на считающие строки."""
+    counter = RowCounter()
+
+    def make_cursor(cursor):
+        return RowCountingCursor(cursor, connection, counter)
+
+    connection.make_cursor = connection.make_debug_cursor = make_cursor
+    try:
+        yield counter
+    finally:
+        del connection.make_cursor, connection.make_debug_cursor
+
+
+class TemplateTimer:
+    """Время рендеринга шаблонов верхнего уровня: вложенные
+    include и теги рендерятся внутри и отдельно не считаются."""
+
+    def __init__(self):
+        self.duration = 0.0
+        self.depth = 0
+
+
+@contextmanager
+def time_templates():
+    timer = TemplateTimer()
+    original = Template.render
+
+    def render(self, *args, **kwargs):
+        timer.depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            timer.depth -= 1
+            if not timer.depth:
+                timer.duration += time.perf_counter() - start
+
+    Template.render = render
+    try:
+        yield timer
+    finally:
+        Template.render = original
+
+
+def percentile(values, fraction):
+    """Перцентиль по ближайшему рангу."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def sample(client, url):
+    """Один GET ``url``: (статус, время, запросы, строки, шаблоны)."""
+    recorder = QueryRecorder()
+    with count_rows() as counter, time_templates() as timer, \
+            connection.execute_wrapper(recorder):
+        start = time.perf_counter()
+        response = client.get(url)
+        latency = time.perf_counter() - start
+    return (response.status_code, latency, recorder.count, counter.rows,
+            timer.duration)
+
+
+def measure(pages, iterations, warmup=1):
+    """Замеряет страницы ``{имя: (клиент, адрес)}``.
+
+    Страницы чередуются по кругу, чтобы фоновый шум машины размазался
+    по всем, а не достался одной. Первые ``warmup`` кругов прогревают
+    кэши и не учитываются. Сборщик мусора на время замера выключен,
+    как в ``timeit``: иначе его паузы попадают в p95 случайных страниц.
+    """
+    for _ in range(warmup):
+        for client, url in pages.values():
+            client.get(url)
+    samples = {name: [] for name in pages}
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            for name, (client, url) in pages.items():
+                samples[name].append(sample(client, url))
+    finally:
+        gc.enable()
+    return {
+        name: summarize(pages[name][1], samples[name]) for name in pages
+    }
+
+
+def summarize(url, samples):
+    """Перцентили времени; запросы, строки и шаблоны - медианы."""
+    statuses, latencies, queries, rows, templates = zip(*samples)
+    return {
+        'url': url,
+        'status': statuses[-1],
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'queries': percentile(queries, 0.5),
+        'rows': percentile(rows, 0.5),
+        'template_ms': round(percentile(templates, 0.5) * 1000, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Регрессии относительно эталона: список строк для отчета.
+
+    ``tolerance`` - допустимая доля роста времени (0.25 = +25%).
+    Страницы, которых нет в эталоне, не сравниваются.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['status'] != expected['status']:
+            regressions.append(
+                f'{name}: статус {result["status"]}, '
+                f'в эталоне {expected["status"]}'
+            )
+        for metric in COUNTED_METRICS:
+            if result[metric] > expected[metric]:
+                regressions.append(
+                    f'{name}: {metric} {result[metric]}, '
+                    f'в эталоне {expected[metric]}'
+                )
+        for metric in TIMED_METRICS:
+            factor = TAIL_FACTOR if metric == 'p95_ms' else 1
+            limit = max(
+                expected[metric] * (1 + tolerance * factor),
+                expected[metric] + MIN_SLACK_MS * factor
+            )
+            if result[metric] > limit:
+                regressions.append(
+                    f'{name}: {metric} {result[metric]:.2f}, в эталоне '
+                    f'{expected[metric]:.2f} (предел {limit:.2f})'
+                )
+    return regressions
@@ -0,0 +1,252 @@
+import os
+import pickle
+import stat
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.exceptions import ImproperlyConfigured
+
+_MISSING = object()
+
+
+def check_private(path, info=None):
+    """Отказывается работать с чужим путем кэша.
+
+    Файловые бэкенды распаковывают pickle из того, что прочли: если
+    каталог или файл создал другой пользователь (или их может
+    переписать кто угодно), это выполнение чужого кода в процессе.
+    ``info`` - уже полученный ``os.fstat`` открытого файла.
+    """
+    info = info or os.lstat(path)
+    if stat.S_ISLNK(info.st_mode):
+        raise ImproperlyConfigured(f'Кэш {path} - символическая ссылка')
+    if info.st_uid != os.getuid():
+        raise ImproperlyConfigured(f'Кэш {path} принадлежит другому')
+    if info.st_mode & 0o022:
+        raise ImproperlyConfigured(f'Кэш {path} открыт на запись другим')
+
+
+class PrivateFileBasedCache(FileBasedCache):
+    """FileBasedCache, который создает каталог с правами 0700
+    и не берет каталог, созданный другим пользователем."""
+
+    def _createdir(self):
+        super()._createdir()
+        check_private(self._dir)
+
+
+def reset_version(key):
+    """Заводит версию заново и возвращает ее.
+
+    Версия берется от времени: после вытеснения или истечения ключа
+    она не вернется к уже использованным значениям, и старые данные
+    под ними останутся недоступны.
+    """
+    version = time.time_ns()
+    cache.set(key, version, settings.CACHE_VERSION_TIMEOUT)
+    return version
+
+
+def get_version(key):
+    """Номер версии под ``key`` в кэше по умолчанию."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), settings.CACHE_VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(keys):
+    """{ключ: версия} одним обращением к кэшу; недостающие версии
+    заводятся, как в ``get_version``."""
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        cache.add(key, time.time_ns(), settings.CACHE_VERSION_TIMEOUT)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def bump_version(key):
+    """Сдвигает версию и возвращает новую.
+
+    Данные под прежней версией больше не читаются и уходят из кэша
+    по своему сроку.
+    """
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        return reset_version(key)
+    # incr не везде сохраняет срок ключа: файловый кэш ставит
+    # TIMEOUT бэкенда, memcached оставляет прежний
+    cache.touch(key, settings.CACHE_VERSION_TIMEOUT)
+    return version
+
+
+def is_counter(value):
+    # Числа меняют на месте через incr/decr: это версии ключей
+    # и счетчики, их копию в памяти процесса держат недолго.
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class TwoLevelCache(BaseCache):
+    """Кэш из двух уровней: LRU в памяти процесса перед общим кэшем.
+
+    Общий уровень - другой кэш из ``settings.CACHES`` (опция
+    ``SHARED``): файловый локально, сетевой в бою. Его видят все
+    воркеры, и он главный: запись и удаление идут в него, в LRU
+    остается копия на ``LOCAL_TIMEOUT`` секунд, не больше
+    ``LOCAL_MAX_ENTRIES`` записей.
+
+    Согласованность между воркерами держится на версиях в ключах:
+    данные кладутся под ключом с номером версии, а сами версии -
+    целые числа - живут в LRU только ``VERSION_LOCAL_TIMEOUT``
+    секунд. Иначе теплая страница ходила бы в общий уровень за
+    каждой версией. Сдвиг версии в своем воркере виден сразу,
+    в чужом - не позже чем через ``VERSION_LOCAL_TIMEOUT``.
+    Ключи без версии в чужом воркере могут устареть не дольше
+    чем на ``LOCAL_TIMEOUT``.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._max_local = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._version_timeout = options.get('VERSION_LOCAL_TIMEOUT', 0)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return _MISSING
+            pickled, expires = entry
+            if expires < time.monotonic():
+                del self._local[key]
+                return _MISSING
+            self._local.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def _remember(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if is_counter(value):
+            lifetime = self._version_timeout
+        else:
+            lifetime = self._local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            lifetime = min(lifetime, timeout)
+        if lifetime <= 0:
+            self._forget(key)
+            return
+        # Копия в LRU хранится сериализованной, как в LocMemCache:
+        # изменение полученного объекта не портит кэш.
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[key] = (pickled, time.monotonic() + lifetime)
+            self._local.move_to_end(key)
+            while len(self._local) > self._max_local:
+                self._local.popitem(last=False)
+
+    def _forget(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def _local_key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        value = self._get_local(local_key)
+        if value is not _MISSING:
+            return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._remember(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        for key in keys:
+            value = self._get_local(self._local_key(key, version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            loaded = self.shared.get_many(missing, version=version)
+            for key, value in loaded.items():
+                self._remember(self._local_key(key, version), value)
+            found.update(loaded)
+        return found
+
+    def has_key(self, key, version=None):
+        if self._get_local(self._local_key(key, version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(self._local_key(key, version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self._local_key(key, version)
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._remember(local_key, value, timeout)
+        else:
+            self._forget(local_key)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in (failed or ()):
+                self._remember(self._local_key(key, version), value, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._forget(self._local_key(key, version))
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self._forget(*(self._local_key(key, version) for key in keys))
+        self.shared.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self._local_key(key, version)
+        self._forget(local_key)
+        value = self.shared.incr(key, delta, version=version)
+        self._remember(local_key, value)
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        local_key = self._local_key(key, version)
+        self._forget(local_key)
+        value = self.shared.decr(key, delta, version=version)
+        self._remember(local_key, value)
+        return value
+
+    def clear(self):
+        # LRU других воркеров опустеют сами за LOCAL_TIMEOUT
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
@@ -0,0 +1,19 @@
+from django.db import connections, router
+from django.db.models import AutoField
+
+
+def bulk_batch_size(model, batch_size):
+    """Размер пачки ``bulk_create`` не больше предела базы.
+
+    В Django 2.2 явный ``batch_size`` заменяет предел бэкенда, и на
+    SQLite пачка больше 500 строк падает с "too many terms in compound
+    SELECT". Здесь берется меньшее из заданного и допустимого.
+    """
+    connection = connections[router.db_for_write(model)]
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not isinstance(field, AutoField)
+    ]
+    # Бэкенды без предела возвращают длину списка объектов
+    limit = connection.ops.bulk_batch_size(fields, [None] * batch_size)
+    return max(min(batch_size, limit), 1)
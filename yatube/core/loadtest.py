@@ -0,0 +1,207 @@
+import http.client
+import random
+import time
+from bisect import bisect_left
+from collections import Counter
+from importlib import import_module
+from itertools import accumulate
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY)
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .benchmark import percentile
+
+# Смесь по умолчанию: в основном анонимное чтение, немного
+# ленты подписок и записи от вошедших пользователей.
+DEFAULT_MIX = {
+    'posts:index': 50,
+    'posts:post_detail': 30,
+    'posts:follow_index': 10,
+    'posts:add_comment': 5,
+    'posts:post_create': 5,
+}
+# Страницы, для которых нужен вход
+LOGIN_REQUIRED = {'posts:follow_index', 'posts:add_comment',
+                  'posts:post_create'}
+# Ожидаемый ответ; остальные страницы отвечают 200. Другой статус,
+# например переход на вход при протухшей сессии, считается ошибкой.
+EXPECTED_STATUS = {'posts:add_comment': 302, 'posts:post_create': 302}
+# Верхние границы корзин гистограммы, мс
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+           float('inf'))
+
+
+def parse_mix(value):
+    """``index=50,post_detail=30`` -> {'posts:index': 50, ...}."""
+    mix = {}
+    for part in filter(None, value.split(',')):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if ':' not in name:
+            name = f'posts:{name}'
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Неизвестная страница {name}')
+        mix[name] = float(weight)
+    if not any(mix.values()):
+        raise ValueError('Все веса нулевые')
+    return mix
+
+
+def login_cookie(user):
+    """Cookie сессии вошедшего ``user``, созданной прямо в хранилище.
+
+    Пароль не нужен: у синтетических пользователей его нет.
+    """
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore()
+    session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+class VirtualUser:
+    """Один клиент замкнутого цикла: следующий запрос уходит только
+    после ответа на предыдущий, соединение держится keep-alive."""
+
+    def __init__(self, target, mix, post_ids, cookie, seed):
+        parts = urlsplit(target)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.names = list(mix)
+        self.weights = list(accumulate(mix.values()))
+        self.post_ids = post_ids
+        self.random = random.Random(seed)
+        self.csrf = get_random_string(32)
+        self.cookie = cookie
+        self.connection = None
+
+    def request(self, name):
+        """(метод, путь, тело, заголовки) запроса к странице ``name``."""
+        headers = {}
+        body = None
+        if name in LOGIN_REQUIRED:
+            headers['Cookie'] = (
+                f'{self.cookie}; {settings.CSRF_COOKIE_NAME}={self.csrf}'
+            )
+        if name in ('posts:index', 'posts:follow_index'):
+            return 'GET', reverse(name), body, headers
+        post_id = self.random.choice(self.post_ids)
+        if name == 'posts:post_detail':
+            return 'GET', reverse(name, args=(post_id,)), body, headers
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        body = urlencode({
+            'csrfmiddlewaretoken': self.csrf,
+            'text': f'Нагрузочный тест {time.time()}',
+        })
+        if name == 'posts:add_comment':
+            return 'POST', reverse(name, args=(post_id,)), body, headers
+        return 'POST', reverse(name), body, headers
+
+    def send(self, method, path, body, headers):
+        # Сервер вправе закрыть простаивающее keep-alive соединение:
+        # тогда запрос повторяется один раз на новом, как в urllib3.
+        for retry in (True, False):
+            reused = self.connection is not None
+            if not reused:
+                self.connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=30
+                )
+            try:
+                self.connection.request(method, path, body, headers)
+                response = self.connection.getresponse()
+                response.read()
+                return response.status
+            except (OSError, http.client.HTTPException):
+                self.connection.close()
+                self.connection = None
+                if not (retry and reused):
+                    return None
+
+    def run(self, warmup, duration):
+        """Крутит запросы ``warmup + duration`` секунд; результаты
+        прогрева отбрасываются. Возвращает {страница: статистика}."""
+        stats = {name: {'latencies': [], 'statuses': Counter()}
+                 for name in self.names}
+        start = time.monotonic()
+        record_from = start + warmup
+        deadline = record_from + duration
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            name = self.names[bisect_left(
+                self.weights, self.random.random() * self.weights[-1]
+            )]
+            request = self.request(name)
+            started = time.perf_counter()
+            status = self.send(*request)
+            latency = time.perf_counter() - started
+            if now >= record_from:
+                stats[name]['latencies'].append(latency)
+                stats[name]['statuses'][status] += 1
+        return stats
+
+
+def run_virtual_user(arguments):
+    target, mix, post_ids, cookie, seed, warmup, duration = arguments
+    return VirtualUser(target, mix, post_ids, cookie, seed).run(
+        warmup, duration
+    )
+
+
+def merge(results):
+    """Складывает статистику всех клиентов по страницам."""
+    merged = {}
+    for stats in results:
+        for name, item in stats.items():
+            total = merged.setdefault(
+                name, {'latencies': [], 'statuses': Counter()}
+            )
+            total['latencies'].extend(item['latencies'])
+            total['statuses'].update(item['statuses'])
+    return merged
+
+
+def is_error(name, status):
+    # None - сетевая ошибка или обрыв соединения
+    return status != EXPECTED_STATUS.get(name, 200)
+
+
+def histogram(latencies):
+    """Число ответов по корзинам BUCKETS."""
+    counts = [0] * len(BUCKETS)
+    for latency in latencies:
+        counts[bisect_left(BUCKETS, latency * 1000)] += 1
+    return counts
+
+
+def summarize(merged, duration):
+    """Пропускная способность, доля ошибок, перцентили и гистограмма."""
+    summary = {}
+    for name, item in merged.items():
+        latencies = item['latencies']
+        if not latencies:
+            continue
+        errors = sum(
+            count for status, count in item['statuses'].items()
+            if is_error(name, status)
+        )
+        summary[name] = {
+            'requests': len(latencies),
+            'rps': round(len(latencies) / duration, 1),
+            'error_rate': round(errors / len(latencies), 4),
+            'statuses': {
+                str(status): count
+                for status, count in item['statuses'].items()
+            },
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'histogram': histogram(latencies),
+        }
+    return summary
@@ -0,0 +1,191 @@
+import copy
+import json
+import os
+import re
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+from django.urls import reverse
+
+from core.benchmark import compare, measure
+from posts.models import Group, Post, User
+
+BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'views.json')
+
+
+def isolated_caches(directory):
+    """CACHES проекта с хранилищами во временном каталоге: замер
+    начинается с пустого кэша и не трогает кэш запущенного сервера."""
+    caches = copy.deepcopy(settings.CACHES)
+    caches['shared'].update(
+        BACKEND='core.cache.PrivateFileBasedCache',
+        LOCATION=os.path.join(directory, 'shared'),
+    )
+    caches['shm']['LOCATION'] = os.path.join(directory, 'shm.cache')
+    return caches
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет страницы posts, users и about на временной базе '
+        'с синтетическими данными: p50/p95 времени ответа, число '
+        'SQL-запросов и строк, время шаблонов. Сравнивает с эталоном '
+        'и завершается ошибкой, если страница стала медленнее.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument(
+            '--iterations', type=int, default=50,
+            help='Замеряемых запросов на страницу'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Запросов на прогрев перед замером'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Допустимый рост времени, доля (0.25 = +25%%)'
+        )
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Записать результаты как новый эталон'
+        )
+        parser.add_argument(
+            '--only', action='append',
+            help='Имя URL, например posts:index; можно несколько'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять временную базу; данные создаются один раз'
+        )
+
+    def handle(self, *args, **options):
+        dataset = {'users': options['users'], 'posts': options['posts']}
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(CACHES=isolated_caches(directory)):
+                results = self.measure_all(dataset, options)
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file_:
+                json.dump({'dataset': dataset, 'views': results}, file_,
+                          ensure_ascii=False, indent=2, sort_keys=True)
+                file_.write('\n')
+            self.stdout.write(f'Эталон записан: {options["baseline"]}')
+            return
+        baseline = self.load_baseline(options['baseline'], dataset)
+        self.report(results, baseline)
+        if baseline is None:
+            return
+        regressions = compare(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError(
+                'Регрессии относительно эталона:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def measure_all(self, dataset, options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False,
+            keepdb=options['keepdb']
+        )
+        try:
+            if not Post.objects.exists():
+                call_command(
+                    'seed_yatube', users=dataset['users'],
+                    posts=dataset['posts'], seed=1, stdout=StringIO()
+                )
+            return self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+            teardown_test_environment()
+
+    def pages(self):
+        """(имя URL, клиент, адрес) для самых тяжелых объектов набора."""
+        guest = Client()
+        author = User.objects.annotate(
+            number=Count('posts')
+        ).order_by('-number', 'pk').first()
+        reader = User.objects.annotate(
+            number=Count('follower')
+        ).order_by('-number', 'pk').first()
+        group = Group.objects.order_by('-posts_count', 'pk').first()
+        post = Post.objects.filter(author=author).order_by(
+            '-comments_count', 'pk'
+        ).first()
+        word = max(re.findall(r'\w+', post.text), key=len)
+        as_author = Client()
+        as_author.force_login(author)
+        as_reader = Client()
+        as_reader.force_login(reader)
+        return [
+            ('posts:index', guest, reverse('posts:index')),
+            ('posts:group_list', guest,
+             reverse('posts:group_list', args=(group.slug,))),
+            ('posts:profile', guest,
+             reverse('posts:profile', args=(author.username,))),
+            ('posts:post_detail', guest,
+             reverse('posts:post_detail', args=(post.pk,))),
+            ('posts:search', guest, reverse('posts:search') + f'?q={word}'),
+            ('posts:autocomplete', guest,
+             reverse('posts:autocomplete') + f'?q={author.username[:3]}'),
+            ('posts:follow_index', as_reader, reverse('posts:follow_index')),
+            ('posts:post_create', as_reader, reverse('posts:post_create')),
+            ('posts:post_edit', as_author,
+             reverse('posts:post_edit', args=(post.pk,))),
+            ('users:login', guest, reverse('users:login')),
+            ('users:signup', guest, reverse('users:signup')),
+            ('users:password_reset_form', guest,
+             reverse('users:password_reset_form')),
+            ('about:author', guest, reverse('about:author')),
+            ('about:tech', guest, reverse('about:tech')),
+        ]
+
+    def run(self, options):
+        pages = {
+            name: (client, url) for name, client, url in self.pages()
+            if not options['only'] or name in options['only']
+        }
+        return measure(pages, options['iterations'], options['warmup'])
+
+    def load_baseline(self, path, dataset):
+        if not os.path.exists(path):
+            self.stdout.write(f'Эталона {path} нет, сравнение пропущено')
+            return None
+        with open(path, encoding='utf-8') as file_:
+            baseline = json.load(file_)
+        if baseline['dataset'] != dataset:
+            raise CommandError(
+                f'Эталон снят на других данных: {baseline["dataset"]}'
+            )
+        return baseline['views']
+
+    def report(self, results, baseline):
+        self.stdout.write(
+            f'{"страница":28} {"p50 мс":>8} {"p95 мс":>8} '
+            f'{"запросы":>8} {"строки":>8} {"шаблоны":>8}'
+        )
+        for name, result in results.items():
+            line = (
+                f'{name:28} {result["p50_ms"]:8.2f} {result["p95_ms"]:8.2f} '
+                f'{result["queries"]:8} {result["rows"]:8} '
+                f'{result["template_ms"]:8.2f}'
+            )
+            expected = (baseline or {}).get(name)
+            if expected:
+                line += f'  (эталон p50 {expected["p50_ms"]:.2f})'
+            self.stdout.write(line)
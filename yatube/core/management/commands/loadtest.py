@@ -0,0 +1,165 @@
+import json
+import multiprocessing
+import shutil
+import socket
+import subprocess
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+
+from core.loadtest import (BUCKETS, DEFAULT_MIX, LOGIN_REQUIRED, login_cookie,
+                           merge, parse_mix, run_virtual_user, summarize)
+from posts.models import Post, User
+
+# Сколько последних постов участвует в чтении и комментировании
+HOT_POSTS = 1000
+
+
+def wait_for_port(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест замкнутым циклом против локального gunicorn '
+        'с yatube.wsgi: каждый клиент - отдельный процесс, смесь '
+        'анонимного чтения и действий вошедших пользователей. Печатает '
+        'пропускную способность, долю ошибок и гистограммы задержек '
+        'по именам URL. Пишущие запросы оставляют посты и комментарии '
+        'в базе: запускайте на копии с seed_yatube.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Адрес сервера'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Число одновременных клиентов (процессов)'
+        )
+        parser.add_argument('--duration', type=float, default=30)
+        parser.add_argument(
+            '--warmup', type=float, default=2,
+            help='Секунд в начале, которые не учитываются'
+        )
+        parser.add_argument(
+            '--mix',
+            default=','.join(f'{name}={weight}'
+                             for name, weight in DEFAULT_MIX.items()),
+            help='Веса страниц: index=50,post_detail=30,...'
+        )
+        parser.add_argument(
+            '--spawn-workers', type=int,
+            help='Запустить gunicorn yatube.wsgi с таким числом воркеров'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--json', help='Записать итоги в файл для сравнения прогонов'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        post_ids = list(Post.objects.order_by('-created').values_list(
+            'pk', flat=True
+        )[:HOT_POSTS])
+        if not post_ids:
+            raise CommandError('В базе нет постов: запустите seed_yatube')
+        cookies = [None] * options['concurrency']
+        if any(mix.get(name) for name in LOGIN_REQUIRED):
+            # Вошедшие клиенты - самые подписанные пользователи:
+            # их ленты подписок самые тяжелые
+            users = list(User.objects.annotate(
+                number=Count('follower')
+            ).order_by('-number', 'pk')[:options['concurrency']])
+            cookies = [
+                login_cookie(users[number % len(users)])
+                for number in range(options['concurrency'])
+            ]
+        server = self.spawn(options)
+        try:
+            results = self.run(options, mix, post_ids, cookies)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+        summary = summarize(merge(results), options['duration'])
+        self.report(summary)
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as file_:
+                json.dump(summary, file_, indent=2, sort_keys=True)
+
+    def spawn(self, options):
+        if not options['spawn_workers']:
+            return None
+        if shutil.which('gunicorn') is None:
+            raise CommandError('gunicorn не установлен')
+        target = urlsplit(options['url'])
+        server = subprocess.Popen(
+            [
+                'gunicorn', 'yatube.wsgi',
+                '--workers', str(options['spawn_workers']),
+                '--bind', f'{target.hostname}:{target.port or 80}',
+            ],
+            cwd=settings.BASE_DIR
+        )
+        if not wait_for_port(target.hostname, target.port or 80, 30):
+            server.terminate()
+            raise CommandError('gunicorn не поднялся за 30 секунд')
+        return server
+
+    def run(self, options, mix, post_ids, cookies):
+        # Соединения с БД не должны достаться дочерним процессам
+        connections.close_all()
+        arguments = [
+            (
+                options['url'], mix, post_ids, cookie,
+                options['seed'] + number, options['warmup'],
+                options['duration'],
+            )
+            for number, cookie in enumerate(cookies)
+        ]
+        context = multiprocessing.get_context('fork')
+        with context.Pool(options['concurrency']) as pool:
+            return pool.map(run_virtual_user, arguments)
+
+    def report(self, summary):
+        total = sum(item['requests'] for item in summary.values())
+        rps = sum(item['rps'] for item in summary.values())
+        errors = sum(
+            item['error_rate'] * item['requests'] for item in summary.values()
+        )
+        self.stdout.write(
+            f'Всего: {total} запросов, {rps:.1f} в секунду, '
+            f'ошибок {errors / max(total, 1):.2%}'
+        )
+        for name, item in summary.items():
+            self.stdout.write(
+                f'\n{name}: {item["requests"]} запросов, '
+                f'{item["rps"]} в секунду, ошибок {item["error_rate"]:.2%}, '
+                f'p50 {item["p50_ms"]} мс, p95 {item["p95_ms"]} мс, '
+                f'p99 {item["p99_ms"]} мс, статусы {item["statuses"]}'
+            )
+            widest = max(item['histogram'])
+            for bound, count in zip(BUCKETS, item['histogram']):
+                if not count:
+                    continue
+                label = f'<= {bound:g} мс' if bound != BUCKETS[-1] else (
+                    f'> {BUCKETS[-2]:g} мс'
+                )
+                bar = '#' * max(1, round(40 * count / widest))
+                self.stdout.write(f'  {label:>12} {count:7} {bar}')
@@ -0,0 +1,124 @@
+from django.db import migrations
+
+
+def create_index_concurrently(schema_editor, model, index):
+    """Строит индекс через ``CREATE INDEX CONCURRENTLY`` на PostgreSQL.
+
+    Если прошлая попытка упала посреди построения, индекс с этим
+    именем остается в базе с ``indisvalid = false``: запросы его не
+    используют, а ``IF NOT EXISTS`` счел бы его готовым. Такой индекс
+    сначала удаляется, и построение идет заново.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        # to_regclass ищет имя по search_path, как и DROP INDEX
+        cursor.execute(
+            'SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(%s) '
+            'AND NOT indisvalid',
+            [schema_editor.quote_name(index.name)],
+        )
+        invalid = cursor.fetchone() is not None
+    if invalid:
+        schema_editor.execute(
+            'DROP INDEX CONCURRENTLY IF EXISTS %s'
+            % schema_editor.quote_name(index.name)
+        )
+    sql = str(index.create_sql(model, schema_editor))
+    schema_editor.execute(sql.replace(
+        'CREATE INDEX', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS', 1
+    ))
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """AddIndex, который на PostgreSQL строит индекс без блокировки записи.
+
+    ``CREATE INDEX CONCURRENTLY`` нельзя выполнять в транзакции,
+    поэтому миграция с этой операцией должна иметь ``atomic = False``.
+    На других СУБД работает как обычный AddIndex.
+    """
+
+    def describe(self):
+        return 'Concurrently ' + super().describe()
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            create_index_concurrently(schema_editor, model, self.index)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS %s'
+                % schema_editor.quote_name(self.index.name)
+            )
+
+
+class RemoveIndexConcurrently(migrations.RemoveIndex):
+    """RemoveIndex без блокировки таблицы на PostgreSQL."""
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS %s'
+                % schema_editor.quote_name(self.name)
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            model_state = to_state.models[app_label, self.model_name_lower]
+            index = model_state.get_index_by_name(self.name)
+            create_index_concurrently(schema_editor, model, index)
+
+
+class RunSQLForVendor(migrations.RunSQL):
+    """RunSQL, который выполняется только на СУБД ``vendor``.
+
+    Нужен для возможностей одной СУБД: триггеров, tsvector, FTS5.
+    """
+
+    def __init__(self, vendor, *args, **kwargs):
+        self.vendor = vendor
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        return name, [self.vendor, *args], kwargs
+
+    def describe(self):
+        return f'Raw SQL operation ({self.vendor})'
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == self.vendor:
+            super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
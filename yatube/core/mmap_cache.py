@@ -0,0 +1,352 @@
+import errno
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+from core.cache import check_private
+
+MAGIC = b'YTBSHM01'
+# Заголовок файла: метка, число ячеек, размер ячейки
+FILE_HEADER = struct.Struct('<8sII')
+# Заголовок ячейки: счетчик seqlock, хэш ключа, срок (0 - бессрочно),
+# длина значения. Хэш 0 - пустая ячейка.
+SLOT_HEADER = struct.Struct('<IQdI')
+# Заголовок ячейки без счетчика: пишется, пока счетчик нечетный
+SLOT_FIELDS = struct.Struct('<QdI')
+SEQ_SIZE = SLOT_HEADER.size - SLOT_FIELDS.size
+# Сколько соседних ячеек просматривается для ключа
+PROBES = 8
+# Сколько раз читатель повторяет чтение ячейки, которую пишут,
+# прежде чем взять блокировку
+READ_RETRIES = 100
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def key_hash(key):
+    value = int.from_bytes(
+        hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little'
+    )
+    return value or 1
+
+
+def open_file(path, flags=0):
+    """Открывает файл таблицы. Чужой файл или ссылка на него - отказ:
+    ячейки распаковываются pickle, подложенные данные выполнились бы
+    в воркере."""
+    try:
+        fd = os.open(
+            path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW | flags, 0o600
+        )
+    except OSError as exc:
+        if exc.errno != errno.ELOOP:
+            raise
+        raise ImproperlyConfigured(f'Кэш {path} - символическая ссылка')
+    try:
+        check_private(path, os.fstat(fd))
+    except ImproperlyConfigured:
+        os.close(fd)
+        raise
+    return fd
+
+
+class SharedTable:
+    """Хэш-таблица фиксированного размера в общем mmap-файле.
+
+    Ячейки одинаковой ширины, ключ хранится 64-битным хэшем.
+    Писатели разных процессов сериализуются ``lockf`` на файле
+    (и ``threading.Lock`` внутри процесса), читатели блокировок
+    не берут: каждая ячейка защищена seqlock - писатель делает
+    счетчик нечетным на время записи, читатель повторяет чтение,
+    если счетчик нечетный или изменился за время чтения.
+    """
+
+    def __init__(self, path, slots, slot_size):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.capacity = slot_size - SLOT_HEADER.size
+        size = FILE_HEADER.size + slots * slot_size
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, 0o700, exist_ok=True)
+        check_private(directory)
+        self.thread_lock = threading.Lock()
+        while True:
+            self.fd = open_file(path)
+            with self.write_lock():
+                if self.prepare(path, size):
+                    break
+            # Файл подменили, пока ждали блокировку: открываем новый
+            os.close(self.fd)
+        self.map = mmap.mmap(self.fd, size)
+
+    def header(self):
+        return FILE_HEADER.pack(MAGIC, self.slots, self.slot_size)
+
+    def prepare(self, path, size):
+        """Готов ли открытый файл; вызывается под ``write_lock``.
+
+        Пустой файл размечается на месте: его еще никто не отобразил.
+        Файл другой геометрии уже отображен другими воркерами, и
+        усечение на месте дало бы им мусор или SIGBUS, поэтому
+        размечается новый файл и подменяет старый атомарным rename.
+        Старые воркеры дорабатывают со своим файлом до перезапуска.
+        """
+        try:
+            current = os.path.samestat(os.fstat(self.fd), os.stat(path))
+        except FileNotFoundError:
+            current = False
+        if not current:
+            return False
+        info = os.fstat(self.fd)
+        if info.st_size == 0:
+            self.format(self.fd, size)
+            return True
+        if (
+            info.st_size == size
+            and os.pread(self.fd, FILE_HEADER.size, 0) == self.header()
+        ):
+            return True
+        replacement = f'{path}.{os.getpid()}.new'
+        try:
+            os.unlink(replacement)
+        except FileNotFoundError:
+            pass
+        fd = open_file(replacement, os.O_EXCL)
+        try:
+            self.format(fd, size)
+            os.rename(replacement, path)
+        finally:
+            os.close(fd)
+        return False
+
+    def format(self, fd, size):
+        os.ftruncate(fd, size)
+        # Место под файл выделяется сразу: запись в отображенную дыру
+        # разреженного файла при заполненном диске - SIGBUS в воркере
+        os.posix_fallocate(fd, 0, size)
+        os.pwrite(fd, self.header(), 0)
+
+    @contextmanager
+    def write_lock(self):
+        with self.thread_lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN)
+
+    def offset(self, index):
+        return FILE_HEADER.size + index * self.slot_size
+
+    def candidates(self, hashed):
+        start = hashed % self.slots
+        for step in range(min(PROBES, self.slots)):
+            yield (start + step) % self.slots
+
+    def read_slot(self, index, locked=False):
+        """(хэш, срок, данные) ячейки без блокировки. ``locked`` -
+        блокировку уже держит вызывающий: писать ячейку некому, а
+        брать ``thread_lock`` второй раз нельзя - он не реентерабелен."""
+        if locked:
+            return self.read_locked(index)
+        offset = self.offset(index)
+        for _ in range(READ_RETRIES):
+            seq, hashed, expires, length = SLOT_HEADER.unpack_from(
+                self.map, offset
+            )
+            if seq & 1:
+                continue
+            start = offset + SLOT_HEADER.size
+            data = self.map[start:start + min(length, self.capacity)]
+            if SLOT_HEADER.unpack_from(self.map, offset)[0] == seq:
+                return hashed, expires, data
+        # Ячейку переписывают без перерыва: читаем под блокировкой
+        with self.write_lock():
+            return self.read_locked(index)
+
+    def read_locked(self, index):
+        offset = self.offset(index)
+        _, hashed, expires, length = SLOT_HEADER.unpack_from(
+            self.map, offset
+        )
+        start = offset + SLOT_HEADER.size
+        return hashed, expires, self.map[start:start + length]
+
+    def write_slot(self, index, hashed, expires, data):
+        """Пишет ячейку; вызывается под ``write_lock``."""
+        offset = self.offset(index)
+        seq = SLOT_HEADER.unpack_from(self.map, offset)[0]
+        self.write_seq(offset, seq + 1)
+        start = offset + SLOT_HEADER.size
+        self.map[start:start + len(data)] = data
+        SLOT_FIELDS.pack_into(
+            self.map, offset + SEQ_SIZE, hashed, expires, len(data)
+        )
+        self.write_seq(offset, seq + 2)
+
+    def write_seq(self, offset, seq):
+        # Не struct.pack_into: он сначала обнуляет байты, и читатель
+        # мог увидеть посреди записи четный счетчик 0 и пустую ячейку
+        self.map[offset:offset + SEQ_SIZE] = (seq & 0xffffffff).to_bytes(
+            SEQ_SIZE, 'little'
+        )
+
+    def find(self, hashed, now, locked=False):
+        """Индекс и данные живой ячейки ключа или (None, None)."""
+        for index in self.candidates(hashed):
+            slot_hash, expires, data = self.read_slot(index, locked)
+            if slot_hash == hashed:
+                if expires and expires <= now:
+                    return None, None
+                return index, data
+        return None, None
+
+    def place(self, hashed, now):
+        """Ячейка для записи ключа: его же, пустая или просроченная,
+        иначе та, что истекает раньше остальных. Вызывается под
+        ``write_lock``."""
+        victim, victim_expires = None, None
+        for index in self.candidates(hashed):
+            slot_hash, expires, _ = self.read_locked(index)
+            if slot_hash in (hashed, 0) or (expires and expires <= now):
+                return index
+            rank = expires or float('inf')
+            if victim is None or rank < victim_expires:
+                victim, victim_expires = index, rank
+        return victim
+
+
+def get_table(path, slots, slot_size):
+    # Одна разметка файла на процесс, сколько бы потоков ни создали
+    # свои экземпляры бэкенда
+    with _maps_lock:
+        table = _maps.get(path)
+        if table is None or (table.slots, table.slot_size) != (
+            slots, slot_size
+        ):
+            table = _maps[path] = SharedTable(path, slots, slot_size)
+        return table
+
+
+class MmapCache(BaseCache):
+    """Кэш в общей памяти хоста: mmap-файл, общий для всех воркеров.
+
+    ``LOCATION`` - путь к файлу, ``OPTIONS``: ``SLOTS`` - число ячеек,
+    ``SLOT_SIZE`` - ширина ячейки в байтах. Память постоянна и не
+    зависит от числа воркеров. Значение, которое после pickle не
+    помещается в ячейку, не кэшируется. Подходит для небольших
+    данных, которые читают часто, а меняют редко; между хостами кэш
+    не общий, поэтому ключи стоит строить с версиями из общего кэша.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._table = get_table(
+            location, options.get('SLOTS', 4096),
+            options.get('SLOT_SIZE', 512)
+        )
+
+    def _hash(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key_hash(key)
+
+    def _expires(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return 0.0 if expires is None else expires
+
+    def _pack(self, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return data if len(data) <= self._table.capacity else None
+
+    def get(self, key, default=None, version=None):
+        _, data = self._table.find(self._hash(key, version), time.time())
+        if data is None:
+            return default
+        return pickle.loads(data)
+
+    def _store(self, hashed, value, timeout, only_new=False):
+        data = self._pack(value)
+        now = time.time()
+        table = self._table
+        with table.write_lock():
+            index, _ = table.find(hashed, now, locked=True)
+            if only_new and index is not None:
+                return False
+            if data is None or timeout == 0:
+                # Значение не помещается или сразу истекает:
+                # старое значение ключа тоже убираем
+                if index is not None:
+                    table.write_slot(index, 0, 0.0, b'')
+                return data is not None
+            if index is None:
+                index = table.place(hashed, now)
+            table.write_slot(index, hashed, self._expires(timeout), data)
+            return True
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(self._hash(key, version), value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store(
+            self._hash(key, version), value, timeout, only_new=True
+        )
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        hashed = self._hash(key, version)
+        table = self._table
+        with table.write_lock():
+            index, data = table.find(hashed, time.time(), locked=True)
+            if index is None:
+                return False
+            table.write_slot(index, hashed, self._expires(timeout), data)
+            return True
+
+    def delete(self, key, version=None):
+        hashed = self._hash(key, version)
+        table = self._table
+        with table.write_lock():
+            index, _ = table.find(hashed, time.time(), locked=True)
+            if index is not None:
+                table.write_slot(index, 0, 0.0, b'')
+
+    def has_key(self, key, version=None):
+        hashed = self._hash(key, version)
+        return self._table.find(hashed, time.time())[0] is not None
+
+    def incr(self, key, delta=1, version=None):
+        hashed = self._hash(key, version)
+        table = self._table
+        with table.write_lock():
+            index, data = table.find(hashed, time.time(), locked=True)
+            if index is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(data) + delta
+            packed = self._pack(value)
+            if packed is None:
+                # Как и в _store: новое значение не помещается в ячейку,
+                # старое устарело
+                table.write_slot(index, 0, 0.0, b'')
+                raise ValueError(f"Key '{key}' value does not fit a slot")
+            expires = SLOT_HEADER.unpack_from(
+                table.map, table.offset(index)
+            )[2]
+            table.write_slot(index, hashed, expires, packed)
+            return value
+
+    def clear(self):
+        table = self._table
+        with table.write_lock():
+            for index in range(table.slots):
+                table.write_slot(index, 0, 0.0, b'')
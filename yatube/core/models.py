@@ -2,11 +2,16 @@ from django.db import models
 
 
 class BaseModel(models.Model):
-    """Абстрактная модель. Добавляет дату создания."""
+    """Абстрактная модель. Добавляет даты создания и изменения."""
     created = models.DateTimeField(
         'Дата создания',
         auto_now_add=True
     )
+    # Основа для Last-Modified: меняется при каждом save()
+    modified = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
 
     class Meta:
         # Это абстрактная модель:
@@ -0,0 +1,114 @@
+import logging
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('core.query_budget')
+
+# Запросы фоновой работы, выполненной прямо в запросе (синхронный
+# режим очереди), в бюджет страницы не идут
+_paused = ContextVar('query_budget_paused', default=False)
+
+
+class QueryBudgetExceeded(Exception):
+    """Страница выполнила больше SQL-запросов, чем ей разрешено."""
+
+
+class QueryRecorder:
+    """Считает SQL-запросы и их время через ``execute_wrapper``.
+
+    Запоминает стек вызова первого запроса сверх бюджета:
+    по нему видно, какой шаблон или код дал N+1.
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.count = 0
+        self.duration = 0.0
+        self.offending_stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if _paused.get():
+            return execute(sql, params, many, context)
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.monotonic() - start
+            self.count += 1
+            if self.exceeded and self.offending_stack is None:
+                self.offending_stack = ''.join(traceback.format_stack())
+
+    @property
+    def exceeded(self):
+        return self.budget is not None and self.count > self.budget
+
+    def report(self, url_name):
+        return (
+            f'{url_name}: {self.count} SQL-запросов при бюджете '
+            f'{self.budget}, {self.duration * 1000:.1f} мс\n'
+            f'Первый лишний запрос:\n{self.offending_stack}'
+        )
+
+
+@contextmanager
+def outside_budget():
+    """Запросы внутри блока не считаются в бюджет страницы."""
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+def get_budget(url_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+
+
+class QueryBudgetMiddleware:
+    """Проверяет число SQL-запросов страницы по ``settings.QUERY_BUDGETS``.
+
+    При ``QUERY_BUDGET_RAISE = True`` (тесты) превышение бюджета
+    поднимает исключение, иначе пишется предупреждение в лог.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = request.query_recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        match = request.resolver_match
+        url_name = match.view_name if match else None
+        logger.debug(
+            '%s: %d SQL-запросов, %.1f мс',
+            url_name, recorder.count, recorder.duration * 1000
+        )
+        if recorder.exceeded:
+            report = recorder.report(url_name)
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(report)
+            logger.warning(report)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Бюджет известен только после разрешения URL
+        request.query_recorder.budget = get_budget(
+            request.resolver_match.view_name
+        )
+
+
+@contextmanager
+def assert_query_budget(url_name, budget=None):
+    """Тестовый помощник: падает, если код внутри превысил бюджет."""
+    recorder = QueryRecorder(
+        budget if budget is not None else get_budget(url_name)
+    )
+    with connection.execute_wrapper(recorder):
+        yield recorder
+    assert not recorder.exceeded, recorder.report(url_name)
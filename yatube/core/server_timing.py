@@ -0,0 +1,148 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.backends.django import Template
+from django.utils.module_loading import import_string
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import settings as sorl_settings
+
+logger = logging.getLogger('core.server_timing')
+
+# Фазы запроса: имя метрики Server-Timing -> описание
+PHASES = {
+    'db': 'SQL',
+    'cache': 'Кэш',
+    'tpl': 'Шаблоны',
+    'thumb': 'Миниатюры',
+}
+CACHE_METHODS = (
+    'add', 'get', 'set', 'touch', 'delete', 'get_many', 'has_key', 'incr',
+    'decr', 'set_many', 'delete_many', 'clear', 'get_or_set',
+)
+
+# Замеры текущего запроса; вне запроса (фоновые потоки,
+# команды) - None, и обертки ничего не считают.
+_current = ContextVar('server_timing', default=None)
+
+
+class Timings:
+    """Время и число вызовов по фазам одного запроса."""
+
+    def __init__(self):
+        self.duration = dict.fromkeys(PHASES, 0.0)
+        self.count = dict.fromkeys(PHASES, 0)
+        self.depth = dict.fromkeys(PHASES, 0)
+
+    def measure(self, phase, func, *args, **kwargs):
+        # Вложенные вызовы той же фазы (get_or_set -> get, шаблон
+        # внутри шаблона) входят во внешний и отдельно не считаются.
+        if self.depth[phase]:
+            return func(*args, **kwargs)
+        self.depth[phase] += 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.duration[phase] += time.perf_counter() - start
+            self.count[phase] += 1
+            self.depth[phase] -= 1
+
+    def execute(self, execute, sql, params, many, context):
+        return self.measure('db', execute, sql, params, many, context)
+
+
+def timed(phase, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        timings = _current.get()
+        if timings is None:
+            return func(*args, **kwargs)
+        return timings.measure(phase, func, *args, **kwargs)
+    wrapper.server_timing = True
+    return wrapper
+
+
+def instrument(cls, phase, names):
+    for name in names:
+        method = cls.__dict__.get(name) or getattr(cls, name, None)
+        if method is None or getattr(method, 'server_timing', False):
+            continue
+        setattr(cls, name, timed(phase, method))
+
+
+def install():
+    """Оборачивает бэкенды кэша, шаблоны и sorl-thumbnail.
+
+    SQL считается через ``execute_wrapper`` на время запроса, а у этих
+    слоев такого крючка нет, поэтому методы классов оборачиваются
+    один раз на процесс.
+    """
+    for alias in settings.CACHES:
+        instrument(type(caches[alias]), 'cache', CACHE_METHODS)
+    instrument(Template, 'tpl', ('render',))
+    instrument(ThumbnailBackend, 'thumb', ('get_thumbnail',))
+    instrument(
+        import_string(sorl_settings.THUMBNAIL_BACKEND), 'thumb',
+        ('get_thumbnail',)
+    )
+
+
+def header(timings, total):
+    metrics = [
+        f'{phase};dur={timings.duration[phase] * 1000:.1f};'
+        f'desc="{timings.count[phase]}"'
+        for phase in PHASES if timings.count[phase]
+    ]
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+class ServerTimingMiddleware:
+    """Разбивка времени запроса по фазам: SQL, кэш, шаблоны, миниатюры.
+
+    Пишет заголовок ``Server-Timing`` (его показывает вкладка Network
+    браузера) и строку JSON в лог ``core.server_timing`` с именем URL.
+    Заголовок включает ``SERVER_TIMING_HEADER`` (по умолчанию - в DEBUG).
+    Для потоковых ответов время шаблонов и SQL внутри потока
+    в замер не попадает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        timings = Timings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.execute)
+                    )
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+        if getattr(settings, 'SERVER_TIMING_HEADER', settings.DEBUG):
+            response['Server-Timing'] = header(timings, total)
+        match = request.resolver_match
+        record = {
+            'url_name': match.view_name if match else None,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+        }
+        for phase in PHASES:
+            record[f'{phase}_ms'] = round(timings.duration[phase] * 1000, 1)
+            record[f'{phase}_count'] = timings.count[phase]
+        logger.info(json.dumps(record), extra={'server_timing': record})
+        return response
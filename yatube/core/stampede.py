@@ -0,0 +1,105 @@
+import hashlib
+import math
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache as default_cache
+
+# Сколько живет блокировка, если ее владелец упал, не сняв ее
+LOCK_TIMEOUT = 30
+# Сколько ждать чужого пересчета при пустом кэше, прежде чем
+# посчитать самому, и как часто проверять
+WAIT_TIMEOUT = 2.0
+POLL_INTERVAL = 0.05
+
+
+def lock_key(key):
+    # Ключ блокировки из произвольной строки: memcached не примет
+    # пробелы и ключи длиннее 250 символов
+    return 'lock:' + hashlib.md5(key.encode()).hexdigest()
+
+
+@contextmanager
+def single_flight(key, timeout=LOCK_TIMEOUT, cache=None):
+    """Блокировка в общем кэше на время работы с ``key``.
+
+    Отдает True, если блокировку взял этот вызов: остальные воркеры
+    в это время получают False и не повторяют ту же работу.
+    """
+    cache = cache or default_cache
+    name = lock_key(key)
+    token = uuid.uuid4().hex
+    acquired = cache.add(name, token, timeout)
+    try:
+        yield acquired
+    finally:
+        # Блокировку, истекшую и взятую другим, не снимаем
+        if acquired and cache.get(name) == token:
+            cache.delete(name)
+
+
+def should_refresh(delta, expires, beta=1.0):
+    """XFetch: пересчитать раньше срока с вероятностью, растущей
+    к ``expires`` и с длительностью пересчета ``delta``."""
+    if expires is None:
+        return False
+    return time.time() - delta * beta * math.log(1 - random.random()) >= (
+        expires
+    )
+
+
+def _compute_and_store(cache, key, compute, timeout, stale):
+    start = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - start
+    expires = None if timeout is None else time.time() + timeout
+    # Запись живет дольше логического срока, чтобы было что отдавать,
+    # пока другой воркер пересчитывает
+    cache.set(
+        key, (value, delta, expires),
+        None if timeout is None else timeout + stale
+    )
+    return value
+
+
+def get_or_compute(key, compute, timeout, cache=None, beta=1.0, stale=None):
+    """``cache.get_or_set`` без лавины пересчетов.
+
+    - Значение пересчитывается заранее, до истечения ``timeout``
+      (вероятностно, по XFetch), и только одним воркером.
+    - Пока он считает, остальные отдают прежнее значение, в том числе
+      просроченное не больше чем на ``stale`` секунд (по умолчанию
+      еще один ``timeout``).
+    - При пустом кэше считает один, остальные ждут его результата
+      до ``WAIT_TIMEOUT`` и только потом считают сами.
+
+    В кэше лежит кортеж (значение, время пересчета, срок), поэтому
+    читать ключ нужно тоже через эту функцию.
+    """
+    cache = cache or default_cache
+    if stale is None:
+        stale = timeout or 0
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        if not should_refresh(delta, expires, beta):
+            return value
+        with single_flight(key, cache=cache) as leader:
+            if not leader:
+                return value
+            return _compute_and_store(cache, key, compute, timeout, stale)
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while True:
+        with single_flight(key, cache=cache) as leader:
+            if leader:
+                return _compute_and_store(
+                    cache, key, compute, timeout, stale
+                )
+        if time.monotonic() >= deadline:
+            return compute()
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
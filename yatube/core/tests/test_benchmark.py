@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+
+from core.benchmark import compare, measure
+from core.management.commands.benchmark_views import isolated_caches
+from posts.models import Post, User
+
+EXPECTED = {
+    'url': '/', 'status': 200, 'p50_ms': 10.0, 'p95_ms': 20.0,
+    'queries': 3, 'rows': 10, 'template_ms': 5.0,
+}
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=author) for number in range(3)
+        )
+
+    # Без кэша списков id главная на каждом замере читает базу
+    @override_settings(FEED_CACHE_TIMEOUT=0)
+    def test_measure_counts_queries_rows_and_templates(self):
+        '''Замер видит запросы, строки и время шаблонов страницы'''
+        result = measure({'posts:index': (Client(), '/')}, 3, warmup=0)
+        index = result['posts:index']
+        self.assertEqual(index['status'], 200)
+        self.assertGreater(index['queries'], 0)
+        self.assertGreaterEqual(index['rows'], 3)
+        self.assertGreater(index['template_ms'], 0)
+        self.assertLessEqual(index['p50_ms'], index['p95_ms'])
+
+    def test_compare(self):
+        '''Рост запросов - регрессия, шум времени в пределах допуска - нет'''
+        noisy = dict(EXPECTED, p50_ms=11.5, p95_ms=27.0)
+        self.assertEqual(compare({'posts:index': noisy},
+                                 {'posts:index': EXPECTED}, 0.25), [])
+        slower = dict(EXPECTED, queries=4, p50_ms=15.0)
+        regressions = compare({'posts:index': slower},
+                              {'posts:index': EXPECTED}, 0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertIn('queries', regressions[0])
+        self.assertIn('p50_ms', regressions[1])
+
+    def test_isolated_caches(self):
+        '''Замер пишет кэш только во временный каталог'''
+        caches = isolated_caches('/tmp/bench')
+        self.assertEqual(caches['shared']['LOCATION'], '/tmp/bench/shared')
+        self.assertEqual(caches['shm']['LOCATION'], '/tmp/bench/shm.cache')
+        self.assertEqual(caches['default'], settings.CACHES['default'])
+        self.assertNotEqual(
+            caches['shm']['LOCATION'], settings.CACHES['shm']['LOCATION'])
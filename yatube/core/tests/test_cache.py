@@ -0,0 +1,131 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from core.cache import (PrivateFileBasedCache, TwoLevelCache, bump_version,
+                        get_version, get_versions)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'two-level-tests',
+    },
+})
+class TwoLevelCacheTests(SimpleTestCase):
+    def worker(self, **options):
+        '''Кэш одного воркера; общий уровень у всех один'''
+        return TwoLevelCache('', {'OPTIONS': dict(SHARED='shared', **options)})
+
+    def setUp(self):
+        self.first = self.worker()
+        self.second = self.worker()
+        self.first.clear()
+
+    def test_shared_between_workers(self):
+        '''Запись одного воркера видна другому'''
+        self.first.set('page', [1, 2, 3])
+        self.assertEqual(self.second.get('page'), [1, 2, 3])
+        self.assertEqual(self.second.get_many(['page', 'missing']),
+                         {'page': [1, 2, 3]})
+
+    def test_version_bump_reaches_other_workers(self):
+        '''Без VERSION_LOCAL_TIMEOUT версии читаются из общего уровня'''
+        self.first.set('feed_version', 1)
+        self.assertEqual(self.second.get('feed_version'), 1)
+        self.first.incr('feed_version')
+        self.assertEqual(self.second.get('feed_version'), 2)
+
+    def test_version_kept_locally(self):
+        '''Версия живет в LRU VERSION_LOCAL_TIMEOUT секунд'''
+        first = self.worker(VERSION_LOCAL_TIMEOUT=0.05)
+        second = self.worker(VERSION_LOCAL_TIMEOUT=0.05)
+        first.set('feed_version', 1)
+        self.assertEqual(second.get('feed_version'), 1)
+        second.shared.delete('feed_version')
+        self.assertEqual(second.get('feed_version'), 1)
+        second.shared.set('feed_version', 5)
+        self.assertEqual(first.incr('feed_version'), 6)
+        self.assertEqual(first.get('feed_version'), 6)
+        self.assertEqual(second.get('feed_version'), 1)
+        time.sleep(0.1)
+        self.assertEqual(second.get('feed_version'), 6)
+
+    def test_local_copy(self):
+        '''Данные без версии берутся из LRU и не портятся изменением'''
+        self.first.set('page', [1])
+        self.first.shared.delete('page')
+        page = self.first.get('page')
+        self.assertEqual(page, [1])
+        page.append(2)
+        self.assertEqual(self.first.get('page'), [1])
+        self.assertIsNone(self.second.get('page'))
+
+    def test_local_size_bounded(self):
+        '''В LRU не больше LOCAL_MAX_ENTRIES записей'''
+        cache = self.worker(LOCAL_MAX_ENTRIES=2)
+        for key in 'abc':
+            cache.set(key, key)
+        self.assertEqual(len(cache._local), 2)
+        self.assertEqual(cache.get('a'), 'a')
+
+    def test_delete(self):
+        '''Удаление убирает и копию воркера'''
+        self.first.set('page', 'value')
+        self.first.delete('page')
+        self.assertIsNone(self.first.get('page'))
+
+
+class CacheLocationTests(SimpleTestCase):
+    def test_tests_use_own_cache_dir(self):
+        '''Тесты пишут кэш в свой каталог, а не в кэш сервера'''
+        self.assertNotEqual(settings.CACHE_DIR, tempfile.gettempdir())
+        for alias in ('shared', 'shm'):
+            with self.subTest(alias=alias):
+                self.assertTrue(settings.CACHES[alias]['LOCATION'].startswith(
+                    settings.CACHE_DIR))
+
+    def test_refuses_shared_directory(self):
+        '''Каталог кэша, открытый на запись другим, не используется'''
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        PrivateFileBasedCache(directory, {})
+        os.chmod(directory, 0o777)
+        with self.assertRaises(ImproperlyConfigured):
+            PrivateFileBasedCache(directory, {})
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'version-tests',
+    },
+}, CACHE_VERSION_TIMEOUT=0.05)
+class VersionTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_version(self):
+        '''Сдвиг дает следующую версию, пропавшая заводится больше прежней'''
+        version = get_version('feed_version')
+        self.assertEqual(bump_version('feed_version'), version + 1)
+        cache.delete('feed_version')
+        self.assertGreater(get_version('feed_version'), version + 1)
+
+    def test_versions_expire(self):
+        '''Версии хранятся не дольше CACHE_VERSION_TIMEOUT'''
+        get_version('feed_version')
+        bump_version('feed_version')
+        get_versions(['obj_version:posts.post:1'])
+        time.sleep(0.1)
+        self.assertEqual(cache.get_many(
+            ['feed_version', 'obj_version:posts.post:1']
+        ), {})
@@ -0,0 +1,49 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase
+
+from core.loadtest import parse_mix
+from posts.models import Comment, Follow, Post, User
+
+
+class ParseMixTests(SimpleTestCase):
+    def test_parse_mix(self):
+        '''Короткие имена дополняются пространством posts'''
+        self.assertEqual(parse_mix('index=3,posts:post_detail=1'),
+                         {'posts:index': 3, 'posts:post_detail': 1})
+        with self.assertRaises(ValueError):
+            parse_mix('about:tech=1')
+
+
+class LoadTestCommandTests(LiveServerTestCase):
+    def setUp(self):
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=author)
+        Post.objects.create(text='Пост', author=author)
+
+    def test_loadtest(self):
+        '''Все страницы смеси отвечают без ошибок, итоги пишутся в JSON'''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'loadtest.json')
+            call_command(
+                'loadtest', '--url', self.live_server_url, '--duration', '1',
+                '--warmup', '0', '--concurrency', '2', '--json', path,
+                stdout=StringIO()
+            )
+            with open(path) as file_:
+                summary = json.load(file_)
+        self.assertEqual(set(summary) - {
+            'posts:index', 'posts:post_detail', 'posts:follow_index',
+            'posts:add_comment', 'posts:post_create',
+        }, set())
+        for item in summary.values():
+            self.assertEqual(item['error_rate'], 0)
+            self.assertEqual(sum(item['histogram']), item['requests'])
+        if 'posts:add_comment' in summary:
+            self.assertEqual(Comment.objects.count(),
+                             summary['posts:add_comment']['requests'])
@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from core.mmap_cache import MmapCache, key_hash
+
+
+def write_many(location, rounds):
+    cache = MmapCache(location, {'OPTIONS': {'SLOTS': 64}})
+    for number in range(rounds):
+        cache.set('hot', [number] * 50)
+
+
+class MmapCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'shm.cache')
+        self.cache = MmapCache(self.location, {'OPTIONS': {'SLOTS': 64}})
+
+    def test_basic_operations(self):
+        '''Запись, добавление, счетчик и удаление'''
+        self.cache.set('group', {'slug': 'cats'})
+        self.assertEqual(self.cache.get('group'), {'slug': 'cats'})
+        self.assertFalse(self.cache.add('group', 'other'))
+        self.assertTrue(self.cache.add('version', 1))
+        self.assertEqual(self.cache.incr('version'), 2)
+        self.cache.delete('group')
+        self.assertIsNone(self.cache.get('group'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expiry_and_size_limit(self):
+        '''Истекшие и не влезающие в ячейку значения не отдаются'''
+        self.cache.set('short', 'value', 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.cache.set('large', 'x')
+        self.cache.set('large', 'x' * 1000)
+        self.assertIsNone(self.cache.get('large'))
+
+    def test_incr_beyond_slot(self):
+        '''Счетчик, переросший ячейку, - ValueError, ключ удален'''
+        self.cache.set('counter', 1)
+        with self.assertRaises(ValueError):
+            self.cache.incr('counter', 10 ** 2000)
+        self.assertIsNone(self.cache.get('counter'))
+
+    def test_write_over_stuck_slot(self):
+        '''Запись не виснет на ячейке, которую бросил упавший писатель'''
+        table = self.cache._table
+        hashed = key_hash(self.cache.make_key('stuck'))
+        for index in table.candidates(hashed):
+            # Нечетный счетчик seqlock: запись в ячейку не закончена
+            struct.pack_into('<I', table.map, table.offset(index), 1)
+
+        def write():
+            self.cache.set('stuck', 1)
+            self.cache.incr('stuck')
+            self.cache.delete('stuck')
+        thread = threading.Thread(target=write, daemon=True)
+        thread.start()
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_refuses_foreign_file(self):
+        '''Файл, открытый на запись другим, или ссылку кэш не берет'''
+        location = self.location + '.open'
+        with open(location, 'wb'):
+            pass
+        os.chmod(location, 0o666)
+        link = self.location + '.link'
+        os.symlink(self.location, link)
+        for path in (location, link):
+            with self.subTest(path=path):
+                with self.assertRaises(ImproperlyConfigured):
+                    MmapCache(path, {'OPTIONS': {'SLOTS': 32}})
+
+    def test_new_geometry_replaces_file(self):
+        '''Другая геометрия - новый файл; отображенный старый не трогается'''
+        self.cache.set('kept', 'value')
+        inode = os.stat(self.location).st_ino
+        resized = MmapCache(self.location, {'OPTIONS': {'SLOTS': 32}})
+        self.assertNotEqual(os.stat(self.location).st_ino, inode)
+        self.assertEqual(os.path.getsize(self.location), 16 + 32 * 512)
+        self.assertIsNone(resized.get('kept'))
+        # Воркер со старой разметкой читает свой файл, а не мусор
+        self.assertEqual(self.cache.get('kept'), 'value')
+        resized.set('new', 1)
+        self.assertEqual(
+            MmapCache(self.location, {'OPTIONS': {'SLOTS': 32}}).get('new'),
+            1
+        )
+
+    def test_table_is_bounded(self):
+        '''Ключей больше, чем ячеек: старые вытесняются, файл не растет'''
+        for number in range(500):
+            self.cache.set(f'key{number}', number)
+        self.assertEqual(self.cache.get('key499'), 499)
+        self.assertEqual(os.path.getsize(self.location), 16 + 64 * 512)
+
+    def test_shared_between_processes(self):
+        '''Другой процесс видит записи; чтение во время записи целое'''
+        self.cache.set('hot', [0] * 50)
+        process = multiprocessing.get_context('fork').Process(
+            target=write_many, args=(self.location, 2000)
+        )
+        process.start()
+        while process.is_alive():
+            value = self.cache.get('hot')
+            self.assertEqual(len(set(value)), 1)
+        process.join()
+        self.assertEqual(self.cache.get('hot'), [1999] * 50)
@@ -0,0 +1,58 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+
+from core.query_budget import (QueryBudgetExceeded, QueryRecorder,
+                               assert_query_budget, outside_budget)
+from posts.models import Group, Post, User
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    @override_settings(
+        QUERY_BUDGETS={'posts:index': 0}, QUERY_BUDGET_RAISE=False
+    )
+    def test_budget_exceeded_logs_warning(self):
+        '''В боевом режиме превышение бюджета пишется в лог со стеком'''
+        with self.assertLogs('core.query_budget', 'WARNING') as logs:
+            response = self.guest_client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('posts:index', logs.output[0])
+        self.assertIn('Первый лишний запрос', logs.output[0])
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_budget_exceeded_fails_tests(self):
+        '''Под тестами превышение бюджета - ошибка без настройки'''
+        with self.assertRaises(QueryBudgetExceeded):
+            self.guest_client.get('/')
+
+    def test_pages_fit_budget(self):
+        '''Страницы укладываются в свои бюджеты'''
+        user = User.objects.create_user(username='budget')
+        group = Group.objects.create(
+            title='Группа', slug='budget', description='Описание')
+        Post.objects.create(text='Пост', author=user, group=group)
+        client = Client()
+        client.force_login(user)
+        for url in ('/', '/group/budget/', '/profile/budget/', '/follow/',
+                    '/create/'):
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 200)
+
+    def test_assert_query_budget(self):
+        '''Помощник для тестов падает на превышении бюджета'''
+        with self.assertRaises(AssertionError):
+            with assert_query_budget('posts:index', budget=1):
+                list(User.objects.all())
+                list(User.objects.all())
+
+    def test_outside_budget(self):
+        '''Фоновая работа внутри запроса в бюджет не считается'''
+        recorder = QueryRecorder(budget=0)
+        with connection.execute_wrapper(recorder):
+            with outside_budget():
+                User.objects.count()
+        self.assertEqual(recorder.count, 0)
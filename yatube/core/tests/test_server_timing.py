@@ -0,0 +1,38 @@
+import json
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+
+from posts.models import Post, User
+
+
+class ServerTimingMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='Пост', author=author)
+        self.guest_client = Client()
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_header_and_log(self):
+        '''Заголовок и строка лога содержат фазы и имя URL'''
+        with self.assertLogs('core.server_timing', 'INFO') as logs:
+            response = self.guest_client.get('/')
+        metrics = {
+            metric.split(';')[0]
+            for metric in response['Server-Timing'].split(', ')
+        }
+        self.assertTrue({'db', 'cache', 'tpl', 'total'} <= metrics)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['url_name'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['db_count'], 0)
+        # Шаблоны внутри шаблона считаются одним вызовом
+        self.assertEqual(record['tpl_count'], 1)
+
+    @override_settings(SERVER_TIMING_HEADER=False)
+    def test_header_disabled(self):
+        '''Заголовок можно отключить настройкой, строка лога остается'''
+        with self.assertLogs('core.server_timing', 'INFO'):
+            response = self.guest_client.get('/')
+        self.assertFalse(response.has_header('Server-Timing'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from core.stampede import get_or_compute, should_refresh, single_flight
+
+
+class StampedeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f'value {self.calls}'
+
+    def test_computed_once(self):
+        '''Значение считается один раз и дальше берется из кэша'''
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'value 1')
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'value 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_while_other_worker_refreshes(self):
+        '''Пока пересчитывает другой, отдается прежнее значение'''
+        cache.set('key', ('old', 0.1, time.time() - 1), 60)
+        with single_flight('key') as leader:
+            self.assertTrue(leader)
+            self.assertEqual(get_or_compute('key', self.compute, 60), 'old')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'value 1')
+
+    def test_single_flight(self):
+        '''Блокировку держит один, после выхода ее можно взять снова'''
+        with single_flight('key') as first:
+            with single_flight('key') as second:
+                self.assertTrue(first)
+                self.assertFalse(second)
+        with single_flight('key') as again:
+            self.assertTrue(again)
+
+    def test_should_refresh(self):
+        '''Раннего пересчета нет вдали от срока, после срока - всегда'''
+        self.assertFalse(should_refresh(0.01, time.time() + 3600))
+        self.assertTrue(should_refresh(0.01, time.time() - 1))
+        self.assertFalse(should_refresh(0.01, None))
@@ -1,18 +1,26 @@
 from django.contrib import admin
 
 from .models import Group, Post
+from .search import filter_posts
 
 
 class PostAdmin(admin.ModelAdmin):
     # Перечисляем поля, которые должны отображаться в админке
     list_display = ('pk', 'text', 'created', 'author', 'group')
-    # Добавляем интерфейс для поиска по тексту постов
+    # Добавляем интерфейс для поиска по тексту постов.
+    # Сам поиск идет по полнотекстовому индексу, см. get_search_results
     search_fields = ('text',)
     # Добавляем возможность фильтрации по дате
     list_filter = ('created',)
     empty_value_display = '-пусто-'
     list_editable = ('group',)
 
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        return filter_posts(queryset, search_term), False
+
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group)
@@ -0,0 +1,170 @@
+import threading
+from bisect import bisect_left, insort
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from core.cache import bump_version, get_version, reset_version
+
+from .models import Group, User
+
+VERSION_KEY = 'autocomplete_version'
+# Журнал изменений в общем кэше: запись на каждую версию. Процесс,
+# отставший больше чем на CHANGE_LOG_SIZE версий или потерявший
+# запись журнала, строит индекс заново.
+CHANGE_LOG_SIZE = 1000
+CHANGE_LOG_TIMEOUT = 60 * 60
+
+
+class PrefixIndex:
+    """Отсортированный в памяти процесса список ключей для поиска по префиксу.
+
+    Записи — кортежи ``(ключ, тип, pk)``, ключ в нижнем регистре.
+    Поиск — ``bisect`` к первому ключу не меньше префикса и проход
+    вперед, пока ключи начинаются с префикса. Изменения из своего
+    процесса применяются к списку сразу и пишутся в журнал в общем
+    кэше под номером версии; остальные процессы, увидев новую версию,
+    применяют записи журнала. Весь индекс строится заново только при
+    запуске и если журнала не хватает.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = None
+        self._keys = {}
+        self._payloads = {}
+        self._version = None
+
+    def _load(self):
+        entries, keys, payloads = [], {}, {}
+        for user in User.objects.only('username').iterator():
+            self._collect(
+                entries, keys, payloads, 'user', user.pk, user_payload(user)
+            )
+        for group in Group.objects.only('title', 'slug').iterator():
+            self._collect(
+                entries, keys, payloads, 'group', group.pk,
+                group_payload(group)
+            )
+        entries.sort()
+        return entries, keys, payloads
+
+    @staticmethod
+    def _collect(entries, keys, payloads, kind, pk, payload):
+        # Группа ищется и по названию, и по slug
+        terms = {payload['label'].lower(), payload.get('slug', '').lower()}
+        terms.discard('')
+        keys[kind, pk] = terms
+        payloads[kind, pk] = payload
+        entries.extend((term, kind, pk) for term in terms)
+
+    def _ensure_fresh(self):
+        version = get_version(VERSION_KEY)
+        if self._entries is not None and version == self._version:
+            return
+        if self._entries is not None and self._apply_log(version):
+            return
+        # Версия читается до загрузки: изменения, сделанные во время
+        # нее, применятся из журнала при следующем поиске
+        entries, keys, payloads = self._load()
+        self._entries, self._keys, self._payloads = entries, keys, payloads
+        self._version = version
+
+    def _apply_log(self, version):
+        """Догоняет ``version`` по журналу; False - нужна перестройка."""
+        behind = version - self._version
+        if not 0 < behind <= CHANGE_LOG_SIZE:
+            return False
+        versions = range(self._version + 1, version + 1)
+        changes = cache.get_many([change_key(number) for number in versions])
+        for number in versions:
+            change = changes.get(change_key(number))
+            if change is None:
+                # Последнюю запись писатель мог еще не успеть положить:
+                # дочитаем ее в следующий раз. Пропуск в середине -
+                # запись вытеснена, догнать нельзя.
+                return number == version
+            self._apply(*change)
+            self._version = number
+        return True
+
+    def _apply(self, kind, pk, payload):
+        self._remove(kind, pk)
+        if payload is not None:
+            new = []
+            self._collect(new, self._keys, self._payloads, kind, pk, payload)
+            for entry in new:
+                insort(self._entries, entry)
+
+    def search(self, prefix, kind=None, limit=10):
+        """До ``limit`` объектов, у которых ключ начинается с ``prefix``."""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        with self._lock:
+            self._ensure_fresh()
+            results, seen = [], set()
+            position = bisect_left(self._entries, (prefix,))
+            for term, entry_kind, pk in self._entries[position:]:
+                if not term.startswith(prefix) or len(results) >= limit:
+                    break
+                if kind not in (None, entry_kind) or (entry_kind, pk) in seen:
+                    continue
+                seen.add((entry_kind, pk))
+                results.append(self._payloads[entry_kind, pk])
+            return [dict(payload) for payload in results]
+
+    def _remove(self, kind, pk):
+        for term in self._keys.pop((kind, pk), ()):
+            position = bisect_left(self._entries, (term, kind, pk))
+            if self._entries[position:position + 1] == [(term, kind, pk)]:
+                del self._entries[position]
+        self._payloads.pop((kind, pk), None)
+
+    def update(self, kind, pk, payload=None):
+        """Заменяет или удаляет (``payload=None``) запись объекта."""
+        with self._lock:
+            version = bump_version(VERSION_KEY)
+            cache.set(
+                change_key(version), (kind, pk, payload), CHANGE_LOG_TIMEOUT
+            )
+            # Если версию не сдвигал никто другой, изменение применяется
+            # сразу; иначе его вместе с чужими применит _ensure_fresh
+            if self._entries is not None and version == self._version + 1:
+                self._apply(kind, pk, payload)
+                self._version = version
+
+
+def invalidate():
+    """Перестроить индекс во всех процессах: после записи в обход
+    сигналов. Версия прыгает вперед дальше журнала."""
+    reset_version(VERSION_KEY)
+
+
+def change_key(version):
+    return f'autocomplete_change:{version}'
+
+
+index = PrefixIndex()
+
+
+def user_payload(user):
+    return {'type': 'user', 'label': user.username}
+
+
+def group_payload(group):
+    return {'type': 'group', 'id': group.pk, 'label': group.title,
+            'slug': group.slug}
+
+
+def search(prefix, kind=None, limit=10):
+    """Подсказки для строки ``prefix`` со ссылками на страницы."""
+    results = index.search(prefix, kind, limit)
+    for result in results:
+        if result['type'] == 'user':
+            result['url'] = reverse('posts:profile', args=(result['label'],))
+        else:
+            result['url'] = reverse(
+                'posts:group_list', args=(result.pop('slug'),)
+            )
+    return results
@@ -0,0 +1,85 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.stampede import get_or_compute
+
+from .counters import STATS_FIELDS, get_author_stats
+from .feed_cache import get_feed_version
+from .models import Comment, Follow, Post, User
+
+
+def _etag(request, *parts):
+    """ETag страницы: версия кэша лент, пользователь и параметры URL.
+
+    Версию лент сбрасывают сигналы при любом изменении постов,
+    комментариев и групп, поэтому проверка не требует запросов к базе.
+    Пользователь входит в ключ: в шаблоне есть меню и кнопки автора.
+    """
+    user_id = request.user.pk if request.user.is_authenticated else 0
+    raw = ':'.join(str(part) for part in (
+        get_feed_version(), user_id, request.GET.urlencode(), *parts
+    ))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def page_etag(request, *args, **kwargs):
+    """ETag для index, group_posts и post_detail."""
+    return _etag(request)
+
+
+def profile_etag(request, username):
+    """ETag профиля: счетчики автора и подписка меняются без сигналов
+    лент, поэтому добавляются к ключу отдельно."""
+    # Счетчики из того же кэша, что и на странице: иначе ETag
+    # сменится раньше, чем страница, и браузер закрепит старые цифры
+    try:
+        user_id = User.cached.get(username=username).pk
+    except User.DoesNotExist:
+        user_id = None
+    stats = user_id and get_author_stats(user_id)
+    if stats:
+        stats = [getattr(stats, field) for field in STATS_FIELDS]
+    following = request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author__username=username
+    ).exists()
+    return _etag(request, stats, following)
+
+
+def _last_comment_key(post_id):
+    return f'last_comment:{post_id}'
+
+
+def last_comment_time(post_id):
+    """Время последнего комментария поста; кэшируется до следующего
+    комментария (сбрасывает ``forget_last_comment``)."""
+    return get_or_compute(
+        _last_comment_key(post_id),
+        # Последний комментарий берется по индексу (post, -created)
+        lambda: Comment.objects.filter(post_id=post_id).order_by(
+            '-created'
+        ).values_list('created', flat=True).first(),
+        settings.COUNTER_CACHE_TIMEOUT
+    )
+
+
+def forget_last_comment(post_id):
+    key = _last_comment_key(post_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def post_last_modified(request, post_id):
+    """Время последнего изменения поста или его нового комментария.
+
+    Пост берется из кэша объектов, время комментария - из своего
+    ключа: проверка не требует запросов к базе.
+    """
+    try:
+        post = Post.cached.get(post_id)
+    except Post.DoesNotExist:
+        return None
+    dates = (post.modified, last_comment_time(post_id))
+    return max(date for date in dates if date is not None)
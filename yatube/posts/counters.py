@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.cache import bump_version, get_version
+from core.db import bulk_batch_size
+from core.stampede import get_or_compute
+
+from . import object_cache
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+STATS_FIELDS = ('posts_count', 'followers_count', 'following_count')
+# Версия всех закэшированных счетчиков: сдвигается после пересчета
+STATS_VERSION_KEY = 'author_stats_version'
+
+
+def _shift(queryset, field, delta):
+    """Атомарно сдвигает счетчик, не опуская его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def shift_author_stats(user_id, field, delta):
+    stats = AuthorStats.objects.filter(user_id=user_id)
+    # Уменьшать нечего, а при удалении пользователя запись,
+    # созданная здесь, ссылалась бы на удаленную строку.
+    if delta > 0 and not stats.exists():
+        AuthorStats.objects.get_or_create(user_id=user_id)
+    _shift(stats, field, delta)
+    forget_author_stats(user_id)
+
+
+def shift_group_posts(group_id, delta):
+    if group_id is not None:
+        _shift(Group.objects.filter(pk=group_id), 'posts_count', delta)
+        Group.cached.forget(group_id)
+
+
+def shift_post_comments(post_id, delta):
+    _shift(Post.objects.filter(pk=post_id), 'comments_count', delta)
+    Post.cached.forget(post_id)
+
+
+def _stats_key(user_id):
+    return f'author_stats:{get_version(STATS_VERSION_KEY)}:{user_id}'
+
+
+def get_author_stats(user_id):
+    """Счетчики автора; для пользователя без записи - нули.
+
+    Кэшируются кортежем чисел: профиль популярного автора читают
+    чаще, чем меняются его счетчики.
+    """
+    counts = get_or_compute(
+        _stats_key(user_id),
+        lambda: AuthorStats.objects.filter(
+            user_id=user_id
+        ).values_list(*STATS_FIELDS).first(),
+        settings.COUNTER_CACHE_TIMEOUT
+    )
+    if counts is None:
+        return AuthorStats(user_id=user_id)
+    return AuthorStats(user_id=user_id, **dict(zip(STATS_FIELDS, counts)))
+
+
+def forget_author_stats(user_id):
+    key = _stats_key(user_id)
+    cache.delete(key)
+    # Читатель мог успеть положить в кэш значение до коммита
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def _count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0
+    )
+
+
+def reconcile_counters():
+    """Пересчитывает все счетчики пакетными UPDATE по подзапросам."""
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=pk) for pk in User.objects.filter(
+            stats__isnull=True).values_list('pk', flat=True).iterator()),
+        batch_size=bulk_batch_size(AuthorStats, 1000),
+        ignore_conflicts=True
+    )
+    AuthorStats.objects.update(
+        posts_count=_count(Post.objects.all(), 'author'),
+        followers_count=_count(Follow.objects.all(), 'author'),
+        following_count=_count(Follow.objects.all(), 'user'),
+    )
+    Group.objects.update(posts_count=_count(Post.objects.all(), 'group'))
+    Post.objects.update(
+        comments_count=_count(Comment.objects.all(), 'post')
+    )
+    # Версии сдвигаются сейчас и еще раз после коммита: пересчет
+    # может идти в транзакции загрузки, и читатель успеет закэшировать
+    # под новой версией старые данные
+    for bump in (bump_stats_version, object_cache.invalidate):
+        bump()
+        transaction.on_commit(bump)
+
+
+def bump_stats_version():
+    bump_version(STATS_VERSION_KEY)
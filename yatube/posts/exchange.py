@@ -0,0 +1,130 @@
+import gzip
+import io
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from . import autocomplete
+from .counters import reconcile_counters
+from .feed_cache import bump_feed_ids_version
+from .inbox import fill_inbox_after
+from .models import Comment, Follow, Group, Post
+
+# Формат export_yatube / import_yatube: каждая сущность - файл
+# <имя>.ndjson или <имя>.csv, можно со сжатием .gz. Пользователи
+# передаются по username, группы по slug, посты по id исходной базы.
+#
+# Имя файла -> (модель, [(колонка, путь для values_list)]).
+# Порядок важен для загрузки: группы и посты раньше ссылок на них.
+SPECS = {
+    'groups': (Group, [
+        ('id', 'pk'),
+        ('title', 'title'),
+        ('slug', 'slug'),
+        ('description', 'description'),
+    ]),
+    'posts': (Post, [
+        ('id', 'pk'),
+        ('text', 'text'),
+        ('created', 'created'),
+        ('author', 'author__username'),
+        ('group', 'group__slug'),
+        ('image', 'image'),
+    ]),
+    'comments': (Comment, [
+        ('id', 'pk'),
+        ('post', 'post_id'),
+        ('author', 'author__username'),
+        ('text', 'text'),
+        ('created', 'created'),
+    ]),
+    'follows': (Follow, [
+        ('id', 'pk'),
+        ('user', 'user__username'),
+        ('author', 'author__username'),
+    ]),
+}
+FORMATS = ('ndjson', 'csv')
+
+
+def file_name(name, file_format, compress):
+    return f'{name}.{file_format}' + ('.gz' if compress else '')
+
+
+def open_text(path, mode):
+    """Текстовый файл; ``.gz`` сжимается и распаковывается на лету."""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def has_created(model):
+    return any(field.name == 'created' for field in model._meta.fields)
+
+
+def _copy_value(value):
+    # Текстовый формат COPY: \N - NULL, спецсимволы через обратный слеш
+    if value is None:
+        return '\\N'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def insert_rows(model, fields, rows):
+    """Вставляет строки как есть, без save(), сигналов и auto_now.
+
+    На PostgreSQL - одной командой COPY, иначе executemany INSERT.
+    ``rows`` - последовательности значений полей ``fields``.
+    """
+    fields = [model._meta.get_field(name) for name in fields]
+    prepared = [
+        [
+            field.get_db_prep_save(value, connection)
+            for field, value in zip(fields, row)
+        ]
+        for row in rows
+    ]
+    if not prepared:
+        return
+    table = model._meta.db_table
+    columns = ', '.join(
+        connection.ops.quote_name(field.column) for field in fields
+    )
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO()
+            for row in prepared:
+                buffer.write('\t'.join(map(_copy_value, row)) + '\n')
+            buffer.seek(0)
+            cursor.cursor.copy_expert(
+                f'COPY {table} ({columns}) FROM STDIN', buffer
+            )
+        else:
+            placeholders = ', '.join(['%s'] * len(fields))
+            cursor.executemany(
+                f'INSERT INTO {table} ({columns}) VALUES ({placeholders})',
+                prepared
+            )
+
+
+def finish_bulk_load(models, last_post, last_follow, fill_inbox=True):
+    """То, что при обычной записи делают сигналы: ленты подписок,
+    счетчики и версии кэшей. ``models`` - модели, куда строки шли
+    с явными id: на PostgreSQL их последовательности сдвигаются."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), models
+            ):
+                cursor.execute(sql)
+    if fill_inbox:
+        fill_inbox_after(last_post, last_follow)
+    reconcile_counters()
+    # Загрузка может идти в транзакции: версии кэшей сдвигаются сейчас
+    # и после коммита, иначе читатель закэширует старые данные под
+    # новой версией
+    for bump in (bump_feed_ids_version, autocomplete.invalidate):
+        bump()
+        transaction.on_commit(bump)
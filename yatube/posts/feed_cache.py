@@ -0,0 +1,88 @@
+from array import array
+
+from django.conf import settings
+
+from core.cache import bump_version, get_version
+from core.stampede import get_or_compute
+
+from .pagination import CursorPaginator, page_key, paginate
+
+# Версия содержимого лент (для ETag): меняется при любой правке
+FEED_VERSION_KEY = 'feed_version'
+# Версия списков id в лентах: меняется, только когда пост появился,
+# пропал или сменил группу
+FEED_IDS_VERSION_KEY = 'feed_ids_version'
+
+
+def get_feed_version():
+    """Текущая версия содержимого лент."""
+    return get_version(FEED_VERSION_KEY)
+
+
+def bump_feed_version():
+    """Сбрасывает ETag страниц лент: изменилось то, что на них видно."""
+    bump_version(FEED_VERSION_KEY)
+
+
+def bump_feed_ids_version():
+    """Делает недействительными все закэшированные списки id лент."""
+    bump_version(FEED_IDS_VERSION_KEY)
+    bump_version(FEED_VERSION_KEY)
+
+
+def pack_ids(ids):
+    """id постов в байты ``array('q')``: 8 байт на id без pickle."""
+    return array('q', ids).tobytes()
+
+
+def unpack_ids(packed):
+    ids = array('q')
+    ids.frombytes(packed)
+    return ids.tolist()
+
+
+def hydrate(model, ids):
+    """Посты с авторами и группами по списку id в его порядке.
+
+    Строки берутся одним обращением к кэшу объектов, промахи - одним
+    запросом. Правка поста сбрасывает только его строку, а не все
+    страницы лент, где он есть. Удаленные посты пропускаются.
+    """
+    posts = model.cached.get_many(ids, related=('author', 'group'))
+    return [posts[pk] for pk in ids if pk in posts]
+
+
+def cached_page(request, name, post_list):
+    """Страница ленты с кэшем упорядоченного списка id постов.
+
+    В кэше лежат только упакованные id и курсоры страницы, посты
+    поднимаются через ``hydrate``. Ключ включает версию списков,
+    которую сигналы сбрасывают, когда пост появился, пропал или
+    перешел в другую группу; правка текста ее не трогает. Страницу
+    считает один воркер, остальные ждут его или отдают прежнюю.
+    """
+    version = get_version(FEED_IDS_VERSION_KEY)
+    key = f'feed:{version}:{name}:{page_key(request)}'
+
+    def compute():
+        # Для списка id и курсоров хватает id и даты
+        page_obj = paginate(request, post_list.only('created'))
+        return (
+            pack_ids(post.pk for post in page_obj),
+            page_obj.number,
+            page_obj.paginator.num_pages,
+            page_obj.previous_cursor,
+            page_obj.next_cursor,
+        )
+
+    packed, number, num_pages, previous_cursor, next_cursor = (
+        get_or_compute(key, compute, settings.FEED_CACHE_TIMEOUT)
+    )
+    paginator = CursorPaginator(post_list, settings.PAGES_NUMBER)
+    paginator.num_pages = num_pages
+    page_obj = paginator._get_page(
+        hydrate(post_list.model, unpack_ids(packed)), number, paginator
+    )
+    page_obj.previous_cursor = previous_cursor
+    page_obj.next_cursor = next_cursor
+    return page_obj
@@ -1,12 +1,14 @@
 from django import forms
 from .models import Comment, Post
+from .widgets import AutocompleteSelect
 
 
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
-        widgets = {'group': forms.Select()}
+        # Группы подгружаются подсказками, а не списком всех <option>
+        widgets = {'group': AutocompleteSelect('group')}
 
 
 class CommentForm(forms.ModelForm):
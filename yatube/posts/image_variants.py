@@ -0,0 +1,163 @@
+import io
+import json
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .feed_cache import bump_feed_version
+from .thumbnails import run_in_background
+
+# Форматы от самого компактного к запасному. Последний выводится в <img>
+# и должен открываться любым браузером.
+FORMATS = (
+    ('avif', 'AVIF', 'image/avif'),
+    ('webp', 'WEBP', 'image/webp'),
+    ('jpeg', 'JPEG', 'image/jpeg'),
+)
+
+
+def supported_formats():
+    """Форматы из FORMATS, которые умеет сохранять установленный Pillow.
+
+    AVIF есть в Pillow 11.3+ или с плагином pillow-avif-plugin.
+    """
+    Image.init()
+    return [
+        (ext, pil_format, mime) for ext, pil_format, mime in FORMATS
+        if pil_format in Image.SAVE
+    ]
+
+
+def _variant_widths(source_width):
+    # Картинку не растягиваем сверх исходной ширины, но самый
+    # маленький вариант нужен всегда.
+    widths = sorted(settings.IMAGE_VARIANT_WIDTHS)
+    return [
+        width for width in widths
+        if width <= source_width or width == widths[0]
+    ]
+
+
+def _encode(image, pil_format):
+    buffer = io.BytesIO()
+    if pil_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB' if pil_format == 'JPEG' else 'RGBA')
+    # exif и icc_profile не передаются, поэтому метаданные
+    # (камера, геометка) в варианты не попадают.
+    image.save(
+        buffer, pil_format,
+        quality=settings.IMAGE_VARIANT_QUALITY, optimize=True
+    )
+    return buffer.getvalue()
+
+
+def render_variants(name):
+    """Создает варианты картинки ``name`` и возвращает их описание.
+
+    Картинка поворачивается по EXIF, обрезается по центру под пропорции
+    ``IMAGE_VARIANT_SIZE`` и сохраняется в каждой ширине и каждом
+    поддерживаемом формате рядом с оригиналом, в ``posts/variants/``.
+    """
+    ratio_width, ratio_height = settings.IMAGE_VARIANT_SIZE
+    stem = os.path.splitext(os.path.basename(name))[0]
+    with default_storage.open(name) as file_:
+        source = Image.open(file_)
+        source.load()
+    source = ImageOps.exif_transpose(source)
+    if source.mode == 'P':
+        source = source.convert('RGBA')
+    formats = {}
+    for width in _variant_widths(source.width):
+        height = round(width * ratio_height / ratio_width)
+        image = ImageOps.fit(
+            source, (width, height), Image.LANCZOS, centering=(0.5, 0.5)
+        )
+        image.info = {}
+        for ext, pil_format, _ in supported_formats():
+            saved = default_storage.save(
+                f'posts/variants/{stem}_{width}.{ext}',
+                ContentFile(_encode(image, pil_format))
+            )
+            formats.setdefault(ext, []).append([width, saved])
+    return {'source': name, 'formats': formats}
+
+
+def _delete_files(variants):
+    for files in variants.get('formats', {}).values():
+        for _, name in files:
+            default_storage.delete(name)
+
+
+def load_variants(value):
+    if not value:
+        return {}
+    try:
+        return json.loads(value)
+    except ValueError:
+        return {}
+
+
+def generate_image_variants(model, pk):
+    """Создает варианты картинки поста и записывает их в пост.
+
+    Запись идет через ``update`` с условием на имя картинки: если пост
+    успели отредактировать, результат для старой картинки отбрасывается.
+    """
+    post = model.objects.filter(pk=pk).only(
+        'image', 'image_variants'
+    ).first()
+    if post is None or not post.image:
+        return
+    name = post.image.name
+    variants = render_variants(name)
+    updated = model.objects.filter(pk=pk, image=name).update(
+        image_variants=json.dumps(variants), modified=timezone.now()
+    )
+    if not updated:
+        _delete_files(variants)
+        return
+    model.cached.forget(pk)
+    bump_feed_version()
+    old = load_variants(post.image_variants)
+    if old.get('source') != name:
+        _delete_files(old)
+
+
+def enqueue_image_variants(post):
+    """Ставит создание вариантов картинки поста в фоновую очередь."""
+    if not post.image:
+        return
+    key = ('variants', post.pk, post.image.name)
+    run_in_background(key, generate_image_variants, type(post), post.pk)
+
+
+def picture_sources(post):
+    """Данные для ``<picture>``: ``<source>`` по форматам и запасной ``<img>``.
+
+    Пустой словарь, если вариантов еще нет или они созданы для
+    прежней картинки поста.
+    """
+    variants = load_variants(post.image_variants)
+    if not post.image or variants.get('source') != post.image.name:
+        return {}
+    srcsets = {}
+    for ext, files in variants['formats'].items():
+        srcsets[ext] = ', '.join(
+            f'{default_storage.url(name)} {width}w' for width, name in files
+        )
+    fallback_ext = FORMATS[-1][0]
+    if fallback_ext not in srcsets:
+        return {}
+    fallback = variants['formats'][fallback_ext]
+    return {
+        'sources': [
+            {'type': mime, 'srcset': srcsets[ext]}
+            for ext, _, mime in FORMATS[:-1] if ext in srcsets
+        ],
+        'srcset': srcsets[fallback_ext],
+        'src': default_storage.url(fallback[-1][1]),
+    }
@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from core.db import bulk_batch_size
+
+from .counters import get_author_stats
+from .models import FeedItem, Follow, Post
+from .thumbnails import run_in_background
+
+
+def is_fan_in(author_id):
+    """У автора больше ``FEED_FAN_OUT_LIMIT`` подписчиков.
+
+    Его посты не раскладываются по лентам: рассылка каждого была бы
+    O(подписчиков). Лента подписок добирает их при чтении.
+    """
+    followers = get_author_stats(author_id).followers_count
+    return followers > settings.FEED_FAN_OUT_LIMIT
+
+
+def fan_in_authors(user_id):
+    """id авторов из подписок пользователя, чьи посты читаются
+    при показе ленты, а не из FeedItem."""
+    return list(Follow.objects.filter(
+        user_id=user_id,
+        author__stats__followers_count__gt=settings.FEED_FAN_OUT_LIMIT
+    ).values_list('author_id', flat=True))
+
+
+def follow_feed(user_id, fan_in):
+    """Посты ленты подписок, если в ней есть авторы ``fan_in``:
+    разложенные в FeedItem и посты этих авторов одним запросом."""
+    return Post.objects.filter(
+        Q(pk__in=FeedItem.objects.filter(user_id=user_id).values('post_id'))
+        | Q(author_id__in=fan_in)
+    )
+
+
+def _fan_out(author_id, posts):
+    """Раскладывает посты ``(id, created)`` автора по лентам его
+    подписчиков; пачка подписчиков - своя короткая транзакция."""
+    if not posts:
+        return
+    # В пачке не больше FEED_FAN_OUT_BATCH строк FeedItem
+    step = max(settings.FEED_FAN_OUT_BATCH // len(posts), 1)
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).order_by('user_id').values_list('user_id', flat=True)
+    last = None
+    while True:
+        batch = followers if last is None else followers.filter(
+            user_id__gt=last
+        )
+        user_ids = list(batch[:step])
+        if not user_ids:
+            return
+        with transaction.atomic():
+            FeedItem.objects.bulk_create(
+                [
+                    FeedItem(
+                        user_id=user_id,
+                        post_id=post_id,
+                        author_id=author_id,
+                        created=created
+                    )
+                    for user_id in user_ids
+                    for post_id, created in posts
+                ],
+                batch_size=bulk_batch_size(
+                    FeedItem, settings.FEED_FAN_OUT_BATCH
+                ),
+                ignore_conflicts=True
+            )
+        last = user_ids[-1]
+
+
+def fan_out_post(post_id):
+    """Раскладывает новый пост по лентам всех подписчиков автора."""
+    post = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'created'
+    ).first()
+    if post is None:
+        return
+    author_id, created = post
+    if not is_fan_in(author_id):
+        _fan_out(author_id, [(post_id, created)])
+
+
+def recent_posts(author_id):
+    """Последние ``FEED_BACKFILL_LIMIT`` постов автора: (id, created)."""
+    return list(Post.objects.filter(author_id=author_id).order_by(
+        '-created', '-pk'
+    ).values_list('pk', 'created')[:settings.FEED_BACKFILL_LIMIT])
+
+
+def backfill_inbox(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты автора.
+
+    Более ранние посты лента не показывает: подписка на автора с
+    большой историей не должна писать столько же строк.
+    """
+    if is_fan_in(author_id):
+        return
+    posts = recent_posts(author_id)
+    with transaction.atomic():
+        # Подписчик мог отписаться, пока задача ждала очереди
+        if not Follow.objects.filter(
+            user_id=user_id, author_id=author_id
+        ).exists():
+            return
+        FeedItem.objects.bulk_create(
+            (
+                FeedItem(
+                    user_id=user_id,
+                    post_id=post_id,
+                    author_id=author_id,
+                    created=created
+                )
+                for post_id, created in posts
+            ),
+            batch_size=bulk_batch_size(
+                FeedItem, settings.FEED_FAN_OUT_BATCH
+            ),
+            ignore_conflicts=True
+        )
+
+
+def end_fan_in(author_id):
+    """Раскладывает последние посты автора по лентам подписчиков,
+    когда он перестал быть автором ``is_fan_in``: посты, что лента
+    добирала при чтении, иначе из нее пропали бы."""
+    if not is_fan_in(author_id):
+        _fan_out(author_id, recent_posts(author_id))
+
+
+def enqueue_fan_out(post):
+    """Ставит рассылку нового поста в фоновую очередь после коммита."""
+    run_in_background(('fan_out', post.pk), fan_out_post, post.pk)
+
+
+def enqueue_backfill(follow):
+    """Ставит заполнение ленты нового подписчика в фоновую очередь."""
+    run_in_background(
+        ('backfill', follow.user_id, follow.author_id),
+        backfill_inbox, follow.user_id, follow.author_id
+    )
+
+
+def enqueue_end_fan_in(author_id):
+    """После отписки: если у автора осталось ровно
+    ``FEED_FAN_OUT_LIMIT`` подписчиков, он только что перестал
+    быть автором ``is_fan_in``."""
+    followers = get_author_stats(author_id).followers_count
+    if followers == settings.FEED_FAN_OUT_LIMIT:
+        run_in_background(('end_fan_in', author_id), end_fan_in, author_id)
+
+
+def clear_inbox(user_id, author_id):
+    """Убирает из ленты подписчика посты автора после отписки."""
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def fill_inbox_after(post_id, follow_id):
+    """Раскладывает по лентам посты с id > post_id и посты авторов
+    из подписок с id > follow_id одним INSERT ... SELECT.
+
+    Нужна после массовой загрузки, которая идет в обход сигналов.
+    """
+    insert = 'INSERT INTO'
+    conflict = 'ON CONFLICT DO NOTHING'
+    if connection.vendor == 'sqlite':
+        insert, conflict = 'INSERT OR IGNORE INTO', ''
+    sql = (
+        f'{insert} {FeedItem._meta.db_table} '
+        '(user_id, post_id, author_id, created) '
+        'SELECT f.user_id, p.id, p.author_id, p.created '
+        f'FROM {Follow._meta.db_table} f '
+        f'JOIN {Post._meta.db_table} p ON p.author_id = f.author_id '
+        f'WHERE p.id > %s OR f.id > %s {conflict}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [post_id, follow_id])
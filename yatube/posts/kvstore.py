@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as BaseKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class KVStore(BaseKVStore):
+    """KV-хранилище sorl-thumbnail с LRU в памяти процесса.
+
+    Найденные записи не меняются (ключ строится из имени файла
+    и параметров миниатюры), поэтому живут в LRU до вытеснения.
+    Промахи запоминаются ненадолго: миниатюру может создать фоновая
+    очередь в другом процессе. ``prefetch`` поднимает ключи всей
+    страницы одним ``get_many`` и одним запросом к базе.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _remember(self, key, value):
+        expires = None
+        if value == EMPTY_VALUE:
+            expires = time.monotonic() + settings.THUMBNAIL_LRU_MISS_TIMEOUT
+        with self._lock:
+            self._local[key] = (value, expires)
+            self._local.move_to_end(key)
+            while len(self._local) > settings.THUMBNAIL_LRU_SIZE:
+                self._local.popitem(last=False)
+
+    def _forget(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+
+    def _get_raw(self, key):
+        entry = self._get_local(key)
+        if entry is not None:
+            value = entry[0]
+            return None if value == EMPTY_VALUE else value
+        value = super()._get_raw(key)
+        self._remember(key, EMPTY_VALUE if value is None else value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self._remember(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        self._forget(*keys)
+
+    def prefetch(self, keys):
+        """Загружает в LRU сразу все ключи, которых там еще нет."""
+        missing = [key for key in keys if self._get_local(key) is None]
+        if not missing:
+            return
+        found = self.cache.get_many(missing)
+        rest = [key for key in missing if key not in found]
+        if rest:
+            rows = dict(
+                KVStoreModel.objects.filter(
+                    key__in=rest
+                ).values_list('key', 'value')
+            )
+            loaded = {key: rows.get(key, EMPTY_VALUE) for key in rest}
+            self.cache.set_many(
+                loaded, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+            )
+            found.update(loaded)
+        for key, value in found.items():
+            self._remember(key, value)
@@ -0,0 +1,153 @@
+import random
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.models import Comment, FeedItem, Follow, Group, Post
+from posts.pagination import CursorPaginator, after_position
+
+User = get_user_model()
+
+# Признаки отдельной сортировки в выводе EXPLAIN PostgreSQL и SQLite
+SORT_MARKERS = ('Sort', 'TEMP B-TREE')
+
+
+def is_seq_scan(plan):
+    """Есть ли в плане полный проход по таблице без индекса."""
+    for line in plan.splitlines():
+        if 'Seq Scan' in line:
+            return True
+        # SQLite: "SCAN posts_post" без "USING INDEX"
+        if ' SCAN ' in f' {line} ' and 'USING' not in line:
+            return True
+    return False
+
+
+def is_bounded(plan):
+    """Ограничен ли проход по индексу позицией курсора: условие на
+    created стоит в SEARCH (SQLite) или Index Cond (PostgreSQL),
+    а не в фильтре уже прочитанных строк."""
+    return any(
+        re.search(r'created\s*[<>]', line)
+        for line in plan.splitlines()
+        if 'SEARCH' in line or 'Index Cond' in line
+    )
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает планы (EXPLAIN) горячих запросов лент и отмечает '
+        'полные проходы по таблице и сортировки. С --seed запросы '
+        'выполняются на временных данных, которые потом откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Сколько постов сгенерировать во временной транзакции'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='EXPLAIN ANALYZE (только PostgreSQL)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self.seed(options['seed'])
+                self.explain_all(options['analyze'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, posts_number):
+        users = User.objects.bulk_create(
+            User(username=f'explain_{i}') for i in range(100)
+        )
+        groups = Group.objects.bulk_create(
+            Group(title=f'explain {i}', slug=f'explain-{i}')
+            for i in range(10)
+        )
+        if connection.vendor != 'postgresql':
+            # SQLite не возвращает id из bulk_create
+            users = list(
+                User.objects.filter(username__startswith='explain_'))
+            groups = list(Group.objects.filter(slug__startswith='explain-'))
+        Post.objects.bulk_create(
+            (
+                Post(
+                    text='explain',
+                    author=random.choice(users),
+                    group=random.choice(groups + [None])
+                )
+                for _ in range(posts_number)
+            ),
+            batch_size=500
+        )
+        Follow.objects.bulk_create(
+            (
+                Follow(user=user, author=author)
+                for user in users
+                for author in random.sample(users, 10) if author != user
+            ),
+            ignore_conflicts=True
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def explain_all(self, analyze):
+        post = Post.objects.order_by('-pk').first()
+        user = User.objects.order_by('-pk').first()
+        author_id = post.author_id if post else 0
+        group_id = post.group_id if post else 0
+        ordering = CursorPaginator.ordering
+        queries = {
+            'posts:index': Post.objects.order_by(*ordering),
+            'posts:profile': Post.objects.filter(
+                author_id=author_id).order_by(*ordering),
+            'posts:group_list': Post.objects.filter(
+                group_id=group_id).order_by(*ordering),
+            'posts:post_detail (comments)': Comment.objects.filter(
+                post_id=post.pk if post else 0),
+            'posts:follow_index': FeedItem.objects.filter(
+                user_id=user.pk if user else 0).order_by(*ordering),
+            'fan-out (followers)': Follow.objects.filter(
+                author_id=author_id).values_list('user_id', flat=True),
+        }
+        # Те же ленты со страницы по курсору: проход по индексу должен
+        # начинаться с позиции, а не с начала ленты
+        position = (post.created, post.pk) if post else None
+        cursor_queries = {
+            f'{name} (after)': after_position(queries[name], position)
+            for name in (
+                'posts:index', 'posts:profile', 'posts:group_list',
+                'posts:follow_index',
+            )
+        } if position else {}
+        queries.update(cursor_queries)
+        explain_options = {}
+        if analyze and connection.vendor == 'postgresql':
+            explain_options['analyze'] = True
+        for name, queryset in queries.items():
+            plan = queryset[:11].explain(**explain_options)
+            warnings = []
+            if is_seq_scan(plan):
+                warnings.append('полный проход по таблице')
+            if any(marker in plan for marker in SORT_MARKERS):
+                warnings.append('сортировка')
+            if name in cursor_queries and not is_bounded(plan):
+                warnings.append('проход без границы по курсору')
+            verdict = (
+                self.style.WARNING(', '.join(warnings)) if warnings
+                else self.style.SUCCESS('индекс')
+            )
+            self.stdout.write(f'{name}: {verdict}')
+            self.stdout.write(plan)
+            self.stdout.write('')
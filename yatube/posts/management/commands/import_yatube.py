@@ -0,0 +1,181 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from core.db import bulk_batch_size
+from posts.exchange import (FORMATS, SPECS, file_name, finish_bulk_load,
+                            insert_rows, open_text)
+from posts.models import Comment, Follow, Group, Post, User
+
+
+def read_rows(path):
+    """Строки файла выгрузки как словари, по одной."""
+    with open_text(path, 'r') as file_:
+        if '.csv' in os.path.basename(path):
+            for row in csv.DictReader(file_):
+                yield {key: value or None for key, value in row.items()}
+        else:
+            for line in file_:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def find_file(directory, name):
+    for file_format in FORMATS:
+        for compress in (False, True):
+            path = os.path.join(
+                directory, file_name(name, file_format, compress)
+            )
+            if os.path.exists(path):
+                return path
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает группы, посты, комментарии и подписки из файлов '
+        'export_yatube пакетами: COPY на PostgreSQL, иначе пакетный '
+        'INSERT. Недостающие пользователи создаются без пароля.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            help='Каталог с файлами выгрузки'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Строк в одной пачке'
+        )
+        parser.add_argument(
+            '--keep-ids', action='store_true',
+            help='Сохранить id постов (загрузка в пустую базу). Иначе '
+                 'id сдвигаются за максимальный существующий'
+        )
+
+    def handle(self, *args, **options):
+        directory = options['input']
+        if not os.path.isdir(directory):
+            raise CommandError(f'Нет каталога {directory}')
+        self.batch_size = options['batch_size']
+        last_post = Post.objects.aggregate(Max('pk'))['pk__max'] or 0
+        # Новые id постов - исходные плюс сдвиг за последний id в базе:
+        # комментарии находят свои посты без таблицы соответствия.
+        self.post_shift = 0 if options['keep_ids'] else last_post
+        last_follow = Follow.objects.aggregate(Max('pk'))['pk__max'] or 0
+        # Одна транзакция на всю загрузку: после ошибки в середине
+        # не остается постов без подписок и счетчиков, а повторный
+        # запуск не дублирует уже загруженные посты со сдвинутыми id
+        with transaction.atomic():
+            for name in SPECS:
+                path = find_file(directory, name)
+                if path is None:
+                    continue
+                count = 0
+                for batch in batches(read_rows(path), self.batch_size):
+                    getattr(self, f'load_{name}')(batch)
+                    count += len(batch)
+                self.stdout.write(f'{name}: {count} <- {path}')
+            finish_bulk_load([Post], last_post, last_follow)
+        self.stdout.write(self.style.SUCCESS('Загрузка завершена'))
+
+    def users(self, names):
+        """username -> id; недостающие пользователи создаются."""
+        names = set(filter(None, names))
+        found = dict(User.objects.filter(
+            username__in=names
+        ).values_list('username', 'pk'))
+        missing = names - set(found)
+        if missing:
+            password = make_password(None)
+            User.objects.bulk_create(
+                (User(username=name, password=password) for name in missing),
+                batch_size=bulk_batch_size(User, self.batch_size),
+                ignore_conflicts=True
+            )
+            found.update(User.objects.filter(
+                username__in=missing
+            ).values_list('username', 'pk'))
+        return found
+
+    def load_groups(self, batch):
+        Group.objects.bulk_create(
+            (
+                Group(
+                    title=row['title'], slug=row['slug'],
+                    description=row['description'] or ''
+                )
+                for row in batch
+            ),
+            ignore_conflicts=True
+        )
+
+    def load_posts(self, batch):
+        users = self.users(row['author'] for row in batch)
+        groups = dict(Group.objects.filter(
+            slug__in={row['group'] for row in batch if row['group']}
+        ).values_list('slug', 'pk'))
+        rows = []
+        for row in batch:
+            created = parse_datetime(row['created'])
+            rows.append((
+                int(row['id']) + self.post_shift, row['text'], created,
+                created, users[row['author']], groups.get(row['group']),
+                row['image'] or '', '', 0,
+            ))
+        # Счетчики пересчитываются в конце загрузки
+        insert_rows(Post, (
+            'id', 'text', 'created', 'modified', 'author', 'group', 'image',
+            'image_variants', 'comments_count',
+        ), rows)
+
+    def load_comments(self, batch):
+        users = self.users(row['author'] for row in batch)
+        post_ids = {int(row['post']) + self.post_shift for row in batch}
+        # Комментарии к постам, которых нет в базе, пропускаются
+        known = set(Post.objects.filter(
+            pk__in=post_ids
+        ).values_list('pk', flat=True))
+        rows = []
+        for row in batch:
+            post_id = int(row['post']) + self.post_shift
+            if post_id not in known:
+                continue
+            created = parse_datetime(row['created'])
+            rows.append((
+                post_id, users[row['author']], row['text'], created, created,
+            ))
+        insert_rows(Comment, (
+            'post', 'author', 'text', 'created', 'modified',
+        ), rows)
+
+    def load_follows(self, batch):
+        users = self.users(
+            name for row in batch for name in (row['user'], row['author'])
+        )
+        # Повторные пары отбрасывает ограничение "unique following"
+        Follow.objects.bulk_create(
+            (
+                Follow(user_id=users[row['user']],
+                       author_id=users[row['author']])
+                for row in batch if row['user'] != row['author']
+            ),
+            batch_size=bulk_batch_size(Follow, self.batch_size),
+            ignore_conflicts=True
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики постов, подписок и комментариев'
+
+    def handle(self, *args, **options):
+        reconcile_counters()
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны'))
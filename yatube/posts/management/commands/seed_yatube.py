@@ -0,0 +1,207 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from posts.exchange import finish_bulk_load, insert_rows
+from posts.models import Comment, Follow, Group, Post, User
+
+# Размер заготовок Faker: генерировать текст на каждый из миллионов
+# постов слишком долго, поэтому посты собираются из готовых фраз.
+POOL_SIZE = 2000
+
+
+def zipf_weights(size, exponent):
+    """Накопленные веса распределения Ципфа: ранг 0 - самый популярный."""
+    return list(accumulate(1 / (rank + 1) ** exponent
+                           for rank in range(size)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу синтетическими данными для нагрузочных замеров: '
+        'граф подписок со степенным распределением, посты с перекосом '
+        'по авторам и группам, ветки комментариев. Пишет пачками '
+        'в обход save() и сигналов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument(
+            '--follow-degree', type=int, default=20,
+            help='Среднее число подписок пользователя'
+        )
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument(
+            '--comments-per-post', type=float, default=2.0,
+            help='Среднее число комментариев к посту'
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Показатель распределения Ципфа популярности'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределены даты постов'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--skip-inbox', action='store_true',
+            help='Не раскладывать посты по лентам подписок'
+        )
+        parser.add_argument('--seed', type=int, help='Зерно генератора')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        fake = Faker('ru_RU')
+        fake.seed_instance(options['seed'])
+        self.sentences = [fake.sentence() for _ in range(POOL_SIZE)]
+        self.names = [fake.user_name() for _ in range(POOL_SIZE)]
+
+        last_post = Post.objects.aggregate(Max('pk'))['pk__max'] or 0
+        last_follow = Follow.objects.aggregate(Max('pk'))['pk__max'] or 0
+        users = self.create_users(options['users'])
+        groups = self.create_groups(options['groups'])
+        # Популярность авторов и групп: чем меньше ранг, тем больше
+        # подписчиков, постов и комментариев.
+        user_weights = zipf_weights(len(users), options['exponent'])
+        group_weights = zipf_weights(len(groups), options['exponent'])
+        self.create_follows(users, user_weights, options['follow_degree'])
+        self.create_posts(
+            last_post, options['posts'], users, user_weights,
+            groups, group_weights, options['days'],
+            options['comments_per_post']
+        )
+        finish_bulk_load(
+            [User, Group, Post], last_post, last_follow,
+            fill_inbox=not options['skip_inbox']
+        )
+        self.stdout.write(self.style.SUCCESS('Данные созданы'))
+
+    def write(self, model, fields, rows, label):
+        """Пишет строки пачками, по транзакции на пачку."""
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                with transaction.atomic():
+                    insert_rows(model, fields, batch)
+                count += len(batch)
+                batch = []
+        with transaction.atomic():
+            insert_rows(model, fields, batch)
+        count += len(batch)
+        self.stdout.write(f'{label}: {count}')
+
+    def text(self, sentences):
+        return ' '.join(self.random.choices(self.sentences, k=sentences))
+
+    def create_users(self, number):
+        first = (User.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+        ids = range(first, first + number)
+        password = make_password(None)
+        self.write(User, (
+            'id', 'username', 'password', 'first_name', 'last_name',
+            'email', 'is_superuser', 'is_staff', 'is_active', 'date_joined',
+        ), (
+            (
+                pk, f'{self.random.choice(self.names)}_{pk}', password,
+                '', '', '', False, False, True, self.now,
+            )
+            for pk in ids
+        ), 'users')
+        return ids
+
+    def create_groups(self, number):
+        first = (Group.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+        ids = range(first, first + number)
+        self.write(Group, (
+            'id', 'title', 'slug', 'description', 'posts_count',
+        ), (
+            (pk, self.text(1)[:200], f'seed-{pk}', self.text(3), 0)
+            for pk in ids
+        ), 'groups')
+        return ids
+
+    def create_follows(self, users, weights, degree):
+        def rows():
+            for user_id in users:
+                wanted = min(
+                    round(self.random.expovariate(1 / degree)),
+                    len(users) - 1
+                )
+                authors = set()
+                while len(authors) < wanted:
+                    for rank in self.pick(weights, wanted - len(authors)):
+                        if users[rank] != user_id:
+                            authors.add(users[rank])
+                for author_id in authors:
+                    yield user_id, author_id
+
+        self.write(Follow, ('user', 'author'), rows(), 'follows')
+
+    def pick(self, weights, number):
+        population = range(len(weights))
+        return self.random.choices(population, cum_weights=weights, k=number)
+
+    def create_posts(self, last_post, number, users, user_weights,
+                     groups, group_weights, days, comments_per_post):
+        seconds = days * 24 * 60 * 60
+        # Комментаторы тоже неравны: активных немного
+        commenter_weights = zipf_weights(len(users), 1.0)
+        post_fields = (
+            'id', 'text', 'created', 'modified', 'author', 'group', 'image',
+            'image_variants', 'comments_count',
+        )
+        comment_fields = ('post', 'author', 'text', 'created', 'modified')
+        posts_count = comments_count = 0
+        first = last_post + 1
+        for start in range(first, first + number, self.batch_size):
+            posts, comments = [], []
+            for pk in range(start, min(start + self.batch_size,
+                                       first + number)):
+                author = users[self.pick(user_weights, 1)[0]]
+                # Треть постов без группы
+                group = None
+                if groups and self.random.random() > 1 / 3:
+                    group = groups[self.pick(group_weights, 1)[0]]
+                created = self.now - timedelta(
+                    seconds=self.random.randrange(seconds)
+                )
+                text = self.text(self.random.randint(1, 8))
+                posts.append(
+                    (pk, text, created, created, author, group, '', '', 0)
+                )
+                comments.extend(self.thread(
+                    pk, created, users, commenter_weights, comments_per_post
+                ))
+            with transaction.atomic():
+                insert_rows(Post, post_fields, posts)
+                insert_rows(Comment, comment_fields, comments)
+            posts_count += len(posts)
+            comments_count += len(comments)
+        self.stdout.write(f'posts: {posts_count}')
+        self.stdout.write(f'comments: {comments_count}')
+
+    def thread(self, post_id, created, users, weights, average):
+        """Ветка комментариев поста. Обсуждение сосредоточено на части
+        постов: у каждого четвертого ветка в четыре раза длиннее
+        средней, у остальных комментариев нет."""
+        if not average or self.random.random() > 0.25:
+            return
+        length = round(self.random.expovariate(1 / (average * 4)))
+        for rank in self.pick(weights, length):
+            created += timedelta(seconds=self.random.randrange(1, 3600))
+            if created > self.now:
+                return
+            yield post_id, users[rank], self.text(1), created, created
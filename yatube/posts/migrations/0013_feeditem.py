@@ -0,0 +1,64 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_inbox(apps, schema_editor):
+    # Ленты подписок для уже существующих подписок и постов: тот же
+    # INSERT ... SELECT, что в posts.inbox.fill_inbox_after
+    FeedItem = apps.get_model('posts', 'FeedItem')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    connection = schema_editor.connection
+    insert = 'INSERT INTO'
+    conflict = 'ON CONFLICT DO NOTHING'
+    if connection.vendor == 'sqlite':
+        insert, conflict = 'INSERT OR IGNORE INTO', ''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{insert} {FeedItem._meta.db_table} '
+            '(user_id, post_id, author_id, created) '
+            'SELECT f.user_id, p.id, p.author_id, p.created '
+            f'FROM {Follow._meta.db_table} f '
+            f'JOIN {Post._meta.db_table} p ON p.author_id = f.author_id '
+            f'{conflict}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_auto_20211030_1701'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-created'], name='feed_item_user_created'),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', 'author'], name='feed_item_user_author'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique feed item'),
+        ),
+        migrations.RunPython(fill_inbox, migrations.RunPython.noop),
+    ]
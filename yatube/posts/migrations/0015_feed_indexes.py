@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:38
+
+from django.db import migrations, models
+
+from core.migration_operations import (AddIndexConcurrently,
+                                       RemoveIndexConcurrently)
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('posts', '0014_counters'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='feeditem',
+            name='feed_item_user_created',
+        ),
+        AddIndexConcurrently(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created'], name='comment_post_created'),
+        ),
+        AddIndexConcurrently(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-created', '-id'], name='feed_item_user_created_id'),
+        ),
+        AddIndexConcurrently(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'], name='follow_author_user'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['-created', '-id'], name='post_created_id'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['author', '-created', '-id'], name='post_author_created_id'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['group', '-created', '-id'], name='post_group_created_id'),
+        ),
+    ]
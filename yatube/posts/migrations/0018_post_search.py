@@ -0,0 +1,63 @@
+from django.db import migrations
+
+from core.migration_operations import RunSQLForVendor
+
+# Конфигурация должна совпадать с posts.search.POSTGRES_CONFIG
+POSTGRES_FORWARDS = [
+    'ALTER TABLE posts_post ADD COLUMN search_vector tsvector',
+    "UPDATE posts_post SET search_vector = to_tsvector('russian', text)",
+    'CREATE TRIGGER posts_post_search_vector '
+    'BEFORE INSERT OR UPDATE OF text ON posts_post '
+    'FOR EACH ROW EXECUTE PROCEDURE '
+    "tsvector_update_trigger(search_vector, 'pg_catalog.russian', text)",
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS posts_post_search_vector '
+    'ON posts_post USING gin (search_vector)',
+]
+POSTGRES_BACKWARDS = [
+    'DROP INDEX CONCURRENTLY IF EXISTS posts_post_search_vector',
+    'DROP TRIGGER IF EXISTS posts_post_search_vector ON posts_post',
+    'ALTER TABLE posts_post DROP COLUMN IF EXISTS search_vector',
+]
+
+# Внешняя FTS5-таблица: текст хранится только в posts_post,
+# индекс поддерживают триггеры. Если SQLite пересоздаст posts_post
+# в будущей миграции (AlterField), триггеры нужно создать заново.
+SQLITE_FORWARDS = [
+    'CREATE VIRTUAL TABLE posts_post_fts USING fts5('
+    "text, content='posts_post', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    'CREATE TRIGGER posts_post_fts_insert AFTER INSERT ON posts_post BEGIN '
+    'INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); '
+    'END',
+    'CREATE TRIGGER posts_post_fts_delete AFTER DELETE ON posts_post BEGIN '
+    'INSERT INTO posts_post_fts(posts_post_fts, rowid, text) '
+    "VALUES ('delete', old.id, old.text); "
+    'END',
+    'CREATE TRIGGER posts_post_fts_update AFTER UPDATE OF text ON posts_post '
+    'BEGIN '
+    'INSERT INTO posts_post_fts(posts_post_fts, rowid, text) '
+    "VALUES ('delete', old.id, old.text); "
+    'INSERT INTO posts_post_fts(rowid, text) VALUES (new.id, new.text); '
+    'END',
+    "INSERT INTO posts_post_fts(posts_post_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARDS = [
+    'DROP TRIGGER IF EXISTS posts_post_fts_update',
+    'DROP TRIGGER IF EXISTS posts_post_fts_delete',
+    'DROP TRIGGER IF EXISTS posts_post_fts_insert',
+    'DROP TABLE IF EXISTS posts_post_fts',
+]
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не работает внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('posts', '0017_modified'),
+    ]
+
+    operations = [
+        RunSQLForVendor('postgresql', POSTGRES_FORWARDS, POSTGRES_BACKWARDS),
+        RunSQLForVendor('sqlite', SQLITE_FORWARDS, SQLITE_BACKWARDS),
+    ]
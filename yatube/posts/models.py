@@ -2,11 +2,56 @@ from django.contrib.auth import get_user_model
 from django.db import models
 from core.models import BaseModel
 
+from .image_variants import picture_sources
+from .object_cache import CachedObjects
+
 
 User = get_user_model()
+# Пароль в кэш не попадает: при обращении он подгрузится из базы
+User.add_to_class(
+    'cached', CachedObjects(exclude=('password',), lookups=('username',))
+)
+
+
+class CounterFieldsMixin:
+    """Не перезаписывает счетчики при сохранении существующего объекта.
+
+    Счетчики меняются только атомарными UPDATE с F(), а экземпляр
+    в памяти может хранить устаревшее значение.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and 'update_fields' not in kwargs:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для выдачи мимо кэша объектов (поиск): автор и группа
+        одним JOIN, только поля, которые выводят шаблоны."""
+        return self.select_related('author', 'group').only(
+            'text', 'created', 'image', 'image_variants', 'comments_count',
+            'author', 'author__username',
+            'author__first_name', 'author__last_name',
+            'group', 'group__slug', 'group__title',
+        )
 
 
-class Post(BaseModel):
+class CommentQuerySet(models.QuerySet):
+    def for_thread(self):
+        """Комментарии поста вместе с именами авторов."""
+        return self.select_related('author').only(
+            'text', 'created', 'post', 'author', 'author__username',
+        )
+
+
+class Post(CounterFieldsMixin, BaseModel):
     text = models.TextField(
         'Текст',
         help_text='Текст поста')
@@ -28,20 +73,67 @@ class Post(BaseModel):
         upload_to='posts/',
         blank=True
     )
+    # JSON с адаптивными вариантами картинки (posts.image_variants).
+    # Пишется фоновой задачей после загрузки.
+    image_variants = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    # image_variants тоже пишется через UPDATE в обход save
+    counter_fields = ('comments_count', 'image_variants')
+
+    objects = PostQuerySet.as_manager()
+    cached = CachedObjects()
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def picture(self):
+        return picture_sources(self)
+
     class Meta:
         ordering = ('-created',)
+        # Индексы под курсорную паджинацию лент: (created, id)
+        # внутри автора, группы и всей ленты.
+        indexes = [
+            models.Index(
+                fields=['-created', '-id'],
+                name='post_created_id'
+            ),
+            models.Index(
+                fields=['author', '-created', '-id'],
+                name='post_author_created_id'
+            ),
+            models.Index(
+                fields=['group', '-created', '-id'],
+                name='post_group_created_id'
+            ),
+        ]
 
 
-class Group(models.Model):
+class Group(CounterFieldsMixin, models.Model):
     title = models.CharField(
         'Название группы',
         max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField('Описание')
+    posts_count = models.PositiveIntegerField(
+        'Число постов',
+        default=0,
+        editable=False
+    )
+
+    counter_fields = ('posts_count',)
+
+    cached = CachedObjects(lookups=('slug',))
 
     def __str__(self):
         return self.title
@@ -66,8 +158,16 @@ class Comment(BaseModel):
         auto_now_add=True
     )
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ('-created',)
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='comment_post_created'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -89,3 +189,70 @@ class Follow(models.Model):
                 name='unique following'
             )
         ]
+        # Подписчики автора одним index-only проходом (рассылка постов)
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user'
+            ),
+        ]
+
+
+class FeedItem(models.Model):
+    """Запись ленты подписок: пост автора, на которого подписан user."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_items'
+    )
+    # Автор и дата копируются из поста, чтобы отписка и чтение ленты
+    # обходились без соединения с таблицей постов.
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    created = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ('-created',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique feed item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-id'],
+                name='feed_item_user_created_id'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_item_user_author'
+            ),
+        ]
+
+
+class AuthorStats(models.Model):
+    """Счетчики пользователя: посты, подписчики и подписки."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        'Число подписок',
+        default=0
+    )
@@ -0,0 +1,162 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import Http404
+
+from core.cache import bump_version, get_version, get_versions
+
+# Версия всех ключей кэша объектов: сдвигается после пакетных
+# изменений в обход сигналов (пересчет счетчиков, загрузка)
+VERSION_KEY = 'object_cache_version'
+
+# Модель -> ее CachedObjects, для подгрузки связанных объектов
+registry = {}
+
+
+def invalidate():
+    """Сбрасывает весь кэш объектов: после изменений в обход сигналов."""
+    bump_version(VERSION_KEY)
+
+
+class CachedObjects:
+    """Чтение объектов модели через кэш: ``Post.cached.get(pk)``.
+
+    В кэше (``settings.OBJECT_CACHE``) лежит строка модели - кортеж
+    значений полей в порядке ``fields``, объект собирается из нее
+    ``Model.from_db`` без запроса. Поля из ``exclude`` не кэшируются
+    и при обращении подгружаются из базы как отложенные. По полям
+    из ``lookups`` (slug, username) кэшируется только соответствие
+    значения и pk. Сигналы сохранения и удаления вызывают ``forget``.
+
+    Кэш строк может быть своим у каждого хоста ('shm'), поэтому
+    ключ строки содержит версию объекта из общего кэша по умолчанию:
+    ``forget`` сдвигает ее, и старую строку не видит ни один хост.
+    """
+
+    def __init__(self, exclude=(), lookups=()):
+        self.exclude = set(exclude)
+        self.lookups = lookups
+
+    def contribute_to_class(self, model, name):
+        self.model = model
+        registry[model] = self
+        setattr(model, name, self)
+
+    @property
+    def fields(self):
+        return [
+            field.attname for field in self.model._meta.concrete_fields
+            if field.name not in self.exclude
+        ]
+
+    @property
+    def cache(self):
+        return caches[settings.OBJECT_CACHE]
+
+    def _key(self, *parts):
+        label = self.model._meta.label_lower
+        version = get_version(VERSION_KEY)
+        return ':'.join(map(str, ('obj', version, label, *parts)))
+
+    def _version_key(self, pk):
+        return f'obj_version:{self.model._meta.label_lower}:{pk}'
+
+    def _row_keys(self, pks):
+        """{ключ строки: pk}. Объекты без версии (общий кэш
+        недоступен) в кэш строк не попадают."""
+        version_keys = {self._version_key(pk): pk for pk in pks}
+        versions = get_versions(list(version_keys))
+        prefix = self._key()
+        return {
+            f'{prefix}:{pk}:{versions[key]}': pk
+            for key, pk in version_keys.items() if key in versions
+        }
+
+    def _build(self, row):
+        return self.model.from_db(DEFAULT_DB_ALIAS, self.fields, row)
+
+    def _store(self, keys, rows):
+        pk_index = self.fields.index(self.model._meta.pk.attname)
+        row_keys = {pk: key for key, pk in keys.items()}
+        self.cache.set_many(
+            {
+                row_keys[row[pk_index]]: row for row in rows
+                if row[pk_index] in row_keys
+            },
+            settings.OBJECT_CACHE_TIMEOUT
+        )
+
+    def get_many(self, pks, related=()):
+        """{pk: объект} одним обращением к кэшу и одним запросом
+        к базе за промахами. ``related`` - внешние ключи, объекты
+        которых подгружаются так же из их кэша."""
+        pks = list(dict.fromkeys(pks))
+        keys = self._row_keys(pks)
+        found = {
+            keys[key]: row for key, row in self.cache.get_many(keys).items()
+        }
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            rows = list(self.model._default_manager.filter(
+                pk__in=missing
+            ).values_list(*self.fields))
+            self._store(keys, rows)
+            pk_index = self.fields.index(self.model._meta.pk.attname)
+            found.update((row[pk_index], row) for row in rows)
+        objects = {pk: self._build(found[pk]) for pk in pks if pk in found}
+        self._attach(objects.values(), related)
+        return objects
+
+    def _attach(self, objects, related):
+        for name in related:
+            field = self.model._meta.get_field(name)
+            ids = {getattr(obj, field.attname) for obj in objects}
+            ids.discard(None)
+            loaded = registry[field.related_model].get_many(ids)
+            for obj in objects:
+                value = getattr(obj, field.attname)
+                if value is None or value in loaded:
+                    field.set_cached_value(obj, loaded.get(value))
+
+    def get(self, pk=None, related=(), **lookup):
+        """Объект по pk или по одному полю из ``lookups``;
+        нет объекта - ``DoesNotExist``, как у менеджера."""
+        if pk is None:
+            pk = self._lookup(**lookup)
+        obj = self.get_many([pk], related).get(pk) if pk is not None else None
+        if obj is None:
+            raise self.model.DoesNotExist(
+                f'{self.model._meta.object_name} не найден'
+            )
+        return obj
+
+    def _lookup(self, **lookup):
+        (field, value), = lookup.items()
+        if field not in self.lookups:
+            raise ValueError(f'Поиск по {field} не кэшируется')
+        key = self._key(field, value)
+        pk = self.cache.get(key)
+        if pk is not None:
+            # Значение могли сменить: соответствие проверяется по строке
+            obj = self.get_many([pk]).get(pk)
+            if obj is not None and getattr(obj, field) == value:
+                return pk
+        pk = self.model._default_manager.filter(
+            **lookup
+        ).values_list('pk', flat=True).first()
+        if pk is not None:
+            self.cache.set(key, pk, settings.OBJECT_CACHE_TIMEOUT)
+        return pk
+
+    def get_or_404(self, pk=None, related=(), **lookup):
+        try:
+            return self.get(pk, related, **lookup)
+        except self.model.DoesNotExist:
+            raise Http404(f'{self.model._meta.object_name} не найден')
+
+    def forget(self, pk):
+        """Сдвигает версию объекта сейчас и после коммита:
+        читатель мог успеть положить в кэш строку до коммита."""
+        key = self._version_key(pk)
+        bump_version(key)
+        transaction.on_commit(lambda: bump_version(key))
@@ -0,0 +1,143 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(post):
+    """Кодирует позицию поста (created, id) в непрозрачный токен."""
+    return encode_position(post.created, post.pk)
+
+
+def encode_position(created, pk):
+    raw = f'{created.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает пару (created, id) или None для битого токена."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created, pk = raw.decode().split('|')
+        created = parse_datetime(created)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if created is None:
+        return None
+    return created, pk
+
+
+def after_position(queryset, position):
+    """Строки, идущие в порядке (-created, -id) после позиции.
+
+    Условие ``created <= позиция`` повторяет OR, но его база может
+    взять границей прохода по индексу (created, id); без него план -
+    проход по индексу с начала, и глубокие страницы стоят O(смещения).
+    """
+    created, pk = position
+    return queryset.filter(
+        Q(created__lt=created) | Q(created=created, pk__lt=pk),
+        created__lte=created
+    )
+
+
+def before_position(queryset, position):
+    """Строки, идущие в порядке (-created, -id) до позиции."""
+    created, pk = position
+    return queryset.filter(
+        Q(created__gt=created) | Q(created=created, pk__gt=pk),
+        created__gte=created
+    )
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (created, id): без COUNT(*) и OFFSET.
+
+    Страницы адресуются токенами ``after`` и ``before``. Номер страницы
+    и число страниц известны только относительно текущей страницы,
+    поэтому шаблон должен рисовать ссылки по токенам.
+    """
+    ordering = ('-created', '-pk')
+
+    def __init__(self, object_list, per_page, **kwargs):
+        super().__init__(
+            object_list.order_by(*self.ordering), per_page, **kwargs
+        )
+
+    def get_cursor_page(self, after=None, before=None):
+        position = decode_cursor(before or after)
+        limit = self.per_page + 1
+        if position is None:
+            rows = list(self.object_list[:limit])
+            has_previous = False
+            has_next = len(rows) > self.per_page
+        elif before:
+            rows = list(
+                before_position(self.object_list, position).order_by(
+                    'created', 'pk'
+                )[:limit]
+            )
+            has_previous = len(rows) > self.per_page
+            has_next = True
+            rows = rows[:self.per_page][::-1]
+        else:
+            rows = list(after_position(self.object_list, position)[:limit])
+            has_previous = True
+            has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        # Номер страницы условный: 1 - первая, 2 - любая другая.
+        number = 2 if has_previous else 1
+        self.num_pages = number + 1 if has_next else number
+        return self._with_cursors(self._get_page(rows, number, self))
+
+    def get_numbered_page(self, number):
+        """Совместимость со старыми ссылками вида ``?page=N``."""
+        return self._with_cursors(self.get_page(number))
+
+    def _with_cursors(self, page):
+        rows = page.object_list = list(page.object_list)
+        page.previous_cursor = None
+        page.next_cursor = None
+        if rows and page.has_previous():
+            page.previous_cursor = encode_cursor(rows[0])
+        if rows and page.has_next():
+            page.next_cursor = encode_cursor(rows[-1])
+        return page
+
+
+def paginate(request, post_list):
+    """Возвращает страницу постов по параметрам запроса."""
+    paginator = CursorPaginator(post_list, settings.PAGES_NUMBER)
+    if 'page' in request.GET:
+        return paginator.get_numbered_page(request.GET.get('page'))
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+def page_key(request):
+    """Часть ключа кэша: только то, что выбирает страницу в ``paginate``.
+
+    Прочие параметры запроса (utm-метки, мусор) не плодят ключей, а
+    битые номера и курсоры сводятся к той странице, которую и покажет
+    ``paginate``.
+    """
+    if 'page' in request.GET:
+        try:
+            number = int(request.GET.get('page'))
+        except ValueError:
+            number = 1
+        return f'page={number}'
+    before = request.GET.get('before')
+    position = decode_cursor(before or request.GET.get('after'))
+    if position is None:
+        return 'first'
+    direction = 'before' if before else 'after'
+    return f'{direction}={encode_position(*position)}'
@@ -0,0 +1,171 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# Конфигурация словаря PostgreSQL, та же, что в триггере миграции 0018
+POSTGRES_CONFIG = 'russian'
+# Границы совпадений во фрагменте. Символы из частной области Unicode
+# не встречаются в текстах, поэтому фрагмент можно экранировать целиком
+# и только потом заменить их на <mark>.
+START_MARK = '\ue000'
+STOP_MARK = '\ue001'
+SNIPPET_WORDS = 30
+WORD_RE = re.compile(r'\w+')
+
+
+def search_backend():
+    """'postgresql', 'sqlite' или None, если полнотекстового индекса нет."""
+    if connection.vendor in ('postgresql', 'sqlite'):
+        return connection.vendor
+    return None
+
+
+def fts5_query(query):
+    """Запрос пользователя как безопасное выражение FTS5.
+
+    Каждое слово берется в кавычки (синтаксис FTS5 не применяется),
+    слова объединяются через AND, последнее ищется как префикс.
+    """
+    words = WORD_RE.findall(query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def matching_ids_sql(query):
+    """Подзапрос (sql, params) с id постов, подходящих под запрос."""
+    backend = search_backend()
+    if backend == 'postgresql':
+        return (
+            'SELECT id FROM posts_post '
+            'WHERE search_vector @@ plainto_tsquery(%s, %s)',
+            [POSTGRES_CONFIG, query]
+        )
+    return (
+        'SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s',
+        [fts5_query(query)]
+    )
+
+
+def filter_posts(queryset, query):
+    """Оставляет в queryset посты, найденные полнотекстовым индексом."""
+    if search_backend() is None:
+        return queryset.filter(text__icontains=query)
+    if search_backend() == 'sqlite' and not fts5_query(query):
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(*matching_ids_sql(query)))
+
+
+def _ranked_postgres(query, limit, offset):
+    # ts_headline дорогой, поэтому считается только для строк страницы
+    sql = (
+        'SELECT id, ts_headline(%s, text, query, %s) FROM ('
+        '  SELECT id, text, query, ts_rank_cd(search_vector, query) AS rank'
+        '  FROM posts_post, plainto_tsquery(%s, %s) AS query'
+        '  WHERE search_vector @@ query'
+        '  ORDER BY rank DESC, id DESC LIMIT %s OFFSET %s'
+        ') AS page ORDER BY rank DESC, id DESC'
+    )
+    options = (
+        f'StartSel={START_MARK}, StopSel={STOP_MARK}, '
+        f'MaxWords={SNIPPET_WORDS}, MinWords=10, MaxFragments=2'
+    )
+    params = [
+        POSTGRES_CONFIG, options, POSTGRES_CONFIG, query, limit, offset
+    ]
+    return sql, params
+
+
+def _ranked_sqlite(query, limit, offset):
+    sql = (
+        'SELECT rowid, snippet(posts_post_fts, 0, %s, %s, %s, %s) '
+        'FROM posts_post_fts WHERE posts_post_fts MATCH %s '
+        'ORDER BY rank LIMIT %s OFFSET %s'
+    )
+    params = [
+        START_MARK, STOP_MARK, '…', SNIPPET_WORDS,
+        fts5_query(query), limit, offset
+    ]
+    return sql, params
+
+
+def highlight(fragment):
+    """HTML фрагмента: текст экранирован, совпадения в <mark>."""
+    return mark_safe(
+        escape(fragment)
+        .replace(START_MARK, '<mark>')
+        .replace(STOP_MARK, '</mark>')
+    )
+
+
+def ranked_matches(query, limit, offset=0):
+    """Список (id, фрагмент) найденных постов по убыванию релевантности."""
+    backend = search_backend()
+    if backend is None or not WORD_RE.search(query):
+        return []
+    if backend == 'postgresql':
+        sql, params = _ranked_postgres(query, limit, offset)
+    else:
+        sql, params = _ranked_sqlite(query, limit, offset)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(pk, highlight(fragment)) for pk, fragment in cursor]
+
+
+class SearchPage:
+    """Страница результатов без COUNT(*): на больших выборках подсчет
+    всех совпадений дороже самого поиска. О следующей странице
+    узнаем, запросив на одну строку больше."""
+
+    def __init__(self, object_list, number, has_next):
+        self.object_list = object_list
+        self.number = number
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.number > 1
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+def search_page(queryset, query, number, per_page):
+    """Страница ``number`` найденных постов из ``queryset``.
+
+    У каждого поста есть атрибут ``snippet`` с подсвеченным фрагментом.
+    Номер ограничен ``SEARCH_MAX_PAGES``: дальше OFFSET обходится
+    дороже, чем стоит, и запрос стоит уточнить.
+    """
+    number = min(number, settings.SEARCH_MAX_PAGES)
+    matches = ranked_matches(
+        query, per_page + 1, (number - 1) * per_page
+    )
+    has_next = (
+        len(matches) > per_page and number < settings.SEARCH_MAX_PAGES
+    )
+    matches = matches[:per_page]
+    posts = queryset.in_bulk([pk for pk, _ in matches])
+    object_list = []
+    for pk, snippet in matches:
+        if pk in posts:
+            posts[pk].snippet = snippet
+            object_list.append(posts[pk])
+    return SearchPage(object_list, number, has_next)
@@ -0,0 +1,178 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import autocomplete, object_cache
+from .conditional import forget_last_comment
+from .counters import (shift_author_stats, shift_group_posts,
+                       shift_post_comments)
+from .feed_cache import bump_feed_ids_version, bump_feed_version
+from .inbox import (clear_inbox, enqueue_backfill, enqueue_end_fan_in,
+                    enqueue_fan_out)
+from .models import Comment, Follow, Group, Post, User
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_feeds(sender, **kwargs):
+    bump_feed_version()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_feeds_on_user_change(sender, update_fields=None, **kwargs):
+    # Имя автора выводится у каждого поста; вход в систему
+    # сохраняет только last_login и ETag не трогает
+    if update_fields is not None and not update_fields & {
+        'username', 'first_name', 'last_name'
+    }:
+        return
+    bump_feed_version()
+
+
+# Должен идти до count_saved_post: тот обновляет _initial_group_id
+@receiver(post_save, sender=Post)
+def invalidate_feed_ids(sender, instance, created, **kwargs):
+    # Правка текста или картинки меняет только строку поста в кэше
+    # объектов, списки id в лентах остаются прежними
+    if created or instance.group_id != instance._initial_group_id:
+        bump_feed_ids_version()
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_feed_ids_on_delete(sender, **kwargs):
+    bump_feed_ids_version()
+
+
+@receiver(post_delete, sender=Group)
+def forget_group_posts(sender, **kwargs):
+    # У постов удаленной группы group_id обнулен UPDATE без сигналов:
+    # их строки в кэше объектов сбрасываются все сразу
+    object_cache.invalidate()
+    bump_feed_ids_version()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_object(sender, instance, **kwargs):
+    sender.cached.forget(instance.pk)
+
+
+# Рассылка и заполнение лент идут в фоне после коммита: публикация
+# поста не ждет записи в ленты всех подписчиков
+@receiver(post_save, sender=Post)
+def fan_out_new_post(sender, instance, created, **kwargs):
+    if created:
+        enqueue_fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def fill_inbox_on_follow(sender, instance, created, **kwargs):
+    if created:
+        enqueue_backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_inbox_on_unfollow(sender, instance, **kwargs):
+    clear_inbox(instance.user_id, instance.author_id)
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    # Исходная группа нужна, чтобы перенести счетчик при редактировании.
+    # Через __dict__, чтобы не подгружать отложенное поле.
+    instance._initial_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        shift_author_stats(instance.author_id, 'posts_count', 1)
+        shift_group_posts(instance.group_id, 1)
+    elif instance.group_id != instance._initial_group_id:
+        shift_group_posts(instance._initial_group_id, -1)
+        shift_group_posts(instance.group_id, 1)
+    instance._initial_group_id = instance.group_id
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    shift_author_stats(instance.author_id, 'posts_count', -1)
+    shift_group_posts(instance._initial_group_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        shift_post_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    shift_post_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def forget_comment_time(sender, instance, **kwargs):
+    forget_last_comment(instance.post_id)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        shift_author_stats(instance.author_id, 'followers_count', 1)
+        shift_author_stats(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_unfollow(sender, instance, **kwargs):
+    shift_author_stats(instance.author_id, 'followers_count', -1)
+    shift_author_stats(instance.user_id, 'following_count', -1)
+
+
+# Должен идти после count_unfollow: смотрит на новое число подписчиков
+@receiver(post_delete, sender=Follow)
+def end_fan_in_on_unfollow(sender, instance, **kwargs):
+    enqueue_end_fan_in(instance.author_id)
+
+
+# Индекс подсказок в памяти процесса меняется после коммита: при
+# откате транзакции в нем остался бы объект, которого нет в базе
+@receiver(post_save, sender=User)
+def index_user(sender, instance, created, update_fields, **kwargs):
+    # Вход в систему сохраняет только last_login: индекс не трогаем
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    pk, payload = instance.pk, autocomplete.user_payload(instance)
+    transaction.on_commit(
+        lambda: autocomplete.index.update('user', pk, payload)
+    )
+
+
+@receiver(post_save, sender=Group)
+def index_group(sender, instance, **kwargs):
+    pk, payload = instance.pk, autocomplete.group_payload(instance)
+    transaction.on_commit(
+        lambda: autocomplete.index.update('group', pk, payload)
+    )
+
+
+@receiver(post_delete, sender=User)
+def unindex_user(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete.index.update('user', pk))
+
+
+@receiver(post_delete, sender=Group)
+def unindex_group(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete.index.update('group', pk))
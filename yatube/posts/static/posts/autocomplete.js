@@ -0,0 +1,57 @@
+// Подсказки для полей с data-autocomplete-url.
+// С data-autocomplete-target выбранный id пишется в скрытое поле,
+// без него выбор подсказки открывает ее страницу.
+(function () {
+  if (window.yatubeAutocomplete) {
+    return;
+  }
+  window.yatubeAutocomplete = true;
+
+  function bind(input) {
+    var list = document.getElementById(input.getAttribute('list'));
+    var target = document.getElementById(input.dataset.autocompleteTarget);
+    var results = [];
+    var timer = null;
+
+    function choose() {
+      var chosen = results.filter(function (item) {
+        return item.label === input.value;
+      })[0];
+      if (target) {
+        target.value = chosen ? chosen.id : '';
+      } else if (chosen) {
+        window.location = chosen.url;
+      }
+    }
+
+    input.addEventListener('input', function () {
+      choose();
+      clearTimeout(timer);
+      if (!input.value) {
+        return;
+      }
+      timer = setTimeout(function () {
+        var params = new URLSearchParams({q: input.value});
+        if (input.dataset.autocompleteType) {
+          params.set('type', input.dataset.autocompleteType);
+        }
+        fetch(input.dataset.autocompleteUrl + '?' + params)
+          .then(function (response) { return response.json(); })
+          .then(function (data) {
+            results = data.results;
+            list.innerHTML = '';
+            results.forEach(function (item) {
+              var option = document.createElement('option');
+              option.value = item.label;
+              list.appendChild(option);
+            });
+            choose();
+          });
+      }, 150);
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('[data-autocomplete-url]').forEach(bind);
+  });
+})();
@@ -0,0 +1,170 @@
+import csv
+import gzip
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='export', description='Описание')
+        cls.old_post = Post.objects.create(
+            text='Старый пост', author=cls.author)
+        Post.objects.filter(pk=cls.old_post.pk).update(
+            created=timezone.now() - timedelta(days=10))
+        cls.post = Post.objects.create(
+            text='Новый пост', author=cls.author, group=cls.group)
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def export(self, *args):
+        call_command(
+            'export_yatube', '--output', self.directory, *args,
+            stdout=StringIO()
+        )
+
+    def test_export_ndjson(self):
+        '''Выгрузка в NDJSON с именами вместо id пользователей'''
+        self.export()
+        with open(f'{self.directory}/posts.ndjson', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1]['author'], 'author')
+        self.assertEqual(rows[1]['group'], 'export')
+        with open(f'{self.directory}/follows.ndjson') as f:
+            follow = json.loads(f.readline())
+        self.assertEqual((follow['user'], follow['author']),
+                         ('reader', 'author'))
+
+    def test_export_csv_gzip_since(self):
+        '''CSV со сжатием и выгрузка только новых записей'''
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        self.export('--format', 'csv', '--gzip', '--since', since)
+        with gzip.open(f'{self.directory}/posts.csv.gz', 'rt') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row['text'] for row in rows], ['Новый пост'])
+        with gzip.open(f'{self.directory}/groups.csv.gz', 'rt') as f:
+            self.assertEqual(len(list(csv.DictReader(f))), 1)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(
+            title='Группа', slug='import', description='Описание')
+        self.created = timezone.now() - timedelta(days=30)
+        post = Post.objects.create(
+            text='Пост\tс табуляцией', author=author, group=group)
+        Post.objects.filter(pk=post.pk).update(created=self.created)
+        Comment.objects.create(post=post, author=reader, text='Комментарий')
+        Follow.objects.create(user=reader, author=author)
+        call_command(
+            'export_yatube', '--output', self.directory, '--format', 'csv',
+            stdout=StringIO()
+        )
+        # Другое сообщество: в базе только посторонний пост
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        stranger = User.objects.create_user(username='stranger')
+        Post.objects.create(text='Чужой пост', author=stranger)
+
+    def test_import(self):
+        '''Загрузка переносит данные, даты, связи, счетчики и ленты'''
+        call_command('import_yatube', self.directory, stdout=StringIO())
+        post = Post.objects.get(text='Пост\tс табуляцией')
+        self.assertEqual(post.created, self.created)
+        self.assertEqual(post.author.username, 'author')
+        self.assertEqual(post.group.slug, 'import')
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(post.comments.get().author.username, 'reader')
+        reader = User.objects.get(username='reader')
+        self.assertFalse(reader.has_usable_password())
+        self.assertTrue(
+            Follow.objects.filter(user=reader, author=post.author).exists())
+        self.assertEqual(reader.feed_items.get().post, post)
+        self.assertEqual(post.author.stats.followers_count, 1)
+
+    def test_import_many_follows(self):
+        '''Подписок больше предела пачки SQLite - загрузка проходит'''
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        User.objects.bulk_create(
+            User(username=f'user{number}') for number in range(30))
+        users = list(User.objects.filter(username__startswith='user'))
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author)
+            for user in users for author in users if user != author
+        )
+        call_command(
+            'export_yatube', '--output', directory, stdout=StringIO())
+        Follow.objects.all().delete()
+        call_command('import_yatube', directory, stdout=StringIO())
+        self.assertEqual(Follow.objects.count(), 30 * 29)
+        self.assertEqual(
+            User.objects.get(username='user0').stats.followers_count, 29)
+
+    def test_failed_import_rolls_back(self):
+        '''Ошибка в подписках откатывает всю загрузку'''
+        with open(f'{self.directory}/follows.csv', 'a') as file_:
+            file_.write(',author\n')
+        with self.assertRaises(KeyError):
+            call_command('import_yatube', self.directory, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Comment.objects.exists())
+
+    def test_import_twice_keeps_follows_unique(self):
+        '''Повторная загрузка не дублирует подписки'''
+        call_command('import_yatube', self.directory, stdout=StringIO())
+        call_command('import_yatube', self.directory, stdout=StringIO())
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(Group.objects.count(), 1)
+
+
+class SeedTests(TestCase):
+    def test_seed(self):
+        '''Синтетические данные согласованы: счетчики, даты, ленты'''
+        call_command(
+            'seed_yatube', '--users', '30', '--posts', '200', '--groups',
+            '3', '--follow-degree', '5', '--batch-size', '50', '--seed',
+            '1', stdout=StringIO()
+        )
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertFalse(
+            Follow.objects.filter(user=F('author')).exists())
+        self.assertFalse(
+            Comment.objects.filter(created__lt=F('post__created')).exists())
+        for post in Post.objects.all():
+            self.assertEqual(post.comments_count, post.comments.count())
+        follow = Follow.objects.first()
+        self.assertEqual(
+            follow.user.feed_items.filter(
+                post__author=follow.author).count(),
+            follow.author.posts.count()
+        )
+        # Самый популярный автор пишет больше самого непопулярного
+        first, last = User.objects.order_by('pk')[::29]
+        self.assertGreater(first.posts.count(), last.posts.count())
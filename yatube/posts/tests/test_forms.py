@@ -77,6 +77,17 @@ class PostFormTests(TestCase):
             ).exists()
         )
 
+    def test_invalid_group_shows_form_error(self):
+        '''Мусор вместо pk группы - ошибка формы, а не 500'''
+        for value in ('abc', '999999'):
+            with self.subTest(group=value):
+                response = self.authorized_client.post(
+                    reverse('posts:post_create'),
+                    data={'text': 'Пост', 'group': value}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.context['form'].errors['group'])
+
     def test_post_edit(self):
         '''Тестируем редактирование поста'''
         initial_text = PostFormTests.post.text
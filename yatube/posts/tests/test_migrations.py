@@ -0,0 +1,88 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MigrationTestCase(TransactionTestCase):
+    '''Данные создаются до миграции ``migrate_to`` и проверяются после'''
+    migrate_from = None
+    migrate_to = None
+
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate([('posts', target)])
+        return executor.loader.project_state([('posts', target)]).apps
+
+    def setUp(self):
+        apps = self.migrate(self.migrate_from)
+        self.set_up_before(apps)
+        self.apps = self.migrate(self.migrate_to)
+
+    def tearDown(self):
+        # Возвращаем схему к последней миграции для остальных тестов
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def set_up_before(self, apps):
+        pass
+
+
+class FeedItemBackfillTest(MigrationTestCase):
+    migrate_from = '0012_auto_20211030_1701'
+    migrate_to = '0013_feeditem'
+
+    def set_up_before(self, apps):
+        User = apps.get_model('auth', 'User')
+        author = User.objects.create(username='author')
+        reader = User.objects.create(username='reader')
+        apps.get_model('posts', 'Follow').objects.create(
+            user=reader, author=author)
+        self.post = apps.get_model('posts', 'Post').objects.create(
+            text='Пост до миграции', author=author)
+        self.reader = reader
+
+    def test_existing_follows_fill_inbox(self):
+        '''Лента подписок после миграции содержит старые посты'''
+        FeedItem = self.apps.get_model('posts', 'FeedItem')
+        self.assertEqual(
+            list(FeedItem.objects.values_list('user_id', 'post_id')),
+            [(self.reader.pk, self.post.pk)]
+        )
+
+
+class CountersBackfillTest(MigrationTestCase):
+    migrate_from = '0013_feeditem'
+    migrate_to = '0014_counters'
+
+    def set_up_before(self, apps):
+        User = apps.get_model('auth', 'User')
+        self.author = User.objects.create(username='author')
+        self.reader = User.objects.create(username='reader')
+        self.group = apps.get_model('posts', 'Group').objects.create(
+            title='Группа', slug='group', description='Описание')
+        apps.get_model('posts', 'Follow').objects.create(
+            user=self.reader, author=self.author)
+        Post = apps.get_model('posts', 'Post')
+        self.post = Post.objects.create(
+            text='Пост', author=self.author, group=self.group)
+        Post.objects.create(text='Без группы', author=self.author)
+        apps.get_model('posts', 'Comment').objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+
+    def test_counters_filled(self):
+        '''Счетчики после миграции посчитаны по существующим данным'''
+        stats = self.apps.get_model('posts', 'AuthorStats').objects
+        self.assertEqual(
+            stats.values_list(
+                'posts_count', 'followers_count', 'following_count'
+            ).get(user_id=self.author.pk),
+            (2, 1, 0)
+        )
+        self.assertEqual(
+            stats.get(user_id=self.reader.pk).following_count, 1)
+        self.assertEqual(self.apps.get_model('posts', 'Group').objects.get(
+            pk=self.group.pk).posts_count, 1)
+        self.assertEqual(self.apps.get_model('posts', 'Post').objects.get(
+            pk=self.post.pk).comments_count, 1)
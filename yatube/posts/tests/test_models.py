@@ -1,7 +1,12 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 
-from django.test import TestCase
-from posts.models import Post, Group
+from django.test import TestCase, override_settings
+from posts.counters import get_author_stats
+from posts.models import Comment, Follow, Post, Group
 
 User = get_user_model()
 
@@ -33,3 +38,166 @@ class PostsModelTest(TestCase):
                 self.assertEqual(
                     str(object), expected_value
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание группы')
+
+    def assertCounters(self, posts, followers, group_posts):
+        stats = get_author_stats(self.user.pk)
+        self.assertEqual(stats.posts_count, posts)
+        self.assertEqual(stats.followers_count, followers)
+        self.assertEqual(get_author_stats(self.reader.pk).following_count,
+                         followers)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, group_posts)
+
+    def test_counters_follow_changes(self):
+        """Счетчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(
+            text='Тестовый текст поста',
+            author=self.user,
+            group=self.group)
+        Follow.objects.create(user=self.reader, author=self.user)
+        comment = Comment.objects.create(
+            text='Комментарий', post=post, author=self.reader)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertCounters(posts=1, followers=1, group_posts=1)
+
+        comment.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        post.group = None
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertCounters(posts=1, followers=0, group_posts=0)
+
+        post.delete()
+        self.assertCounters(posts=0, followers=0, group_posts=0)
+
+    def test_reconcile_counters_command(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        Post.objects.bulk_create([
+            Post(text='Без сигналов', author=self.user, group=self.group)
+            for _ in range(3)
+        ])
+        self.assertCounters(posts=0, followers=0, group_posts=0)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCounters(posts=3, followers=0, group_posts=3)
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'objects': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'object-cache-tests',
+        },
+        'other_host': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'object-cache-other-host',
+        },
+    },
+    OBJECT_CACHE='objects'
+)
+class ObjectCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание группы')
+        cls.post = Post.objects.create(
+            text='Тестовый текст поста',
+            author=cls.user,
+            group=cls.group)
+
+    def test_read_through(self):
+        '''Повторное чтение объекта не обращается к базе'''
+        Post.cached.get(self.post.pk)
+        with self.assertNumQueries(0):
+            post = Post.cached.get(self.post.pk)
+        self.assertEqual(post.text, self.post.text)
+        self.assertFalse(post._state.adding)
+        with self.assertRaises(Post.DoesNotExist):
+            Post.cached.get(self.post.pk + 100)
+
+    def test_get_many_with_related(self):
+        '''Пачка постов с авторами и группами из кэша без запросов'''
+        second = Post.objects.create(text='Без группы', author=self.user)
+        pks = [second.pk, self.post.pk]
+        Post.cached.get_many(pks, related=('author', 'group'))
+        with self.assertNumQueries(0):
+            posts = Post.cached.get_many(pks, related=('author', 'group'))
+            self.assertEqual(list(posts), [second.pk, self.post.pk])
+            self.assertEqual(posts[self.post.pk].author.username, 'author')
+            self.assertEqual(posts[self.post.pk].group.slug, 'test_slug')
+            self.assertIsNone(posts[second.pk].group)
+
+    def test_lookup_field(self):
+        '''Поиск по slug и username тоже кэшируется и следит за сменой'''
+        Group.cached.get(slug='test_slug')
+        User.cached.get(username='author')
+        with self.assertNumQueries(0):
+            self.assertEqual(Group.cached.get(slug='test_slug'), self.group)
+            self.assertEqual(User.cached.get(username='author'), self.user)
+        group = Group.objects.get(pk=self.group.pk)
+        group.slug = 'renamed'
+        group.save()
+        with self.assertRaises(Group.DoesNotExist):
+            Group.cached.get(slug='test_slug')
+        self.assertEqual(Group.cached.get(slug='renamed'), self.group)
+
+    def test_user_password_not_cached(self):
+        '''Пароль не хранится в кэше и подгружается по требованию'''
+        user = User.cached.get(self.user.pk)
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertEqual(user.password, self.user.password)
+
+    def test_invalidation(self):
+        '''Сохранение, счетчики и удаление сбрасывают строку в кэше'''
+        post = Post.cached.get(self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(Post.cached.get(post.pk).text, 'Новый текст')
+        Comment.objects.create(post=post, author=self.user, text='Текст')
+        self.assertEqual(Post.cached.get(post.pk).comments_count, 1)
+        self.assertEqual(Group.cached.get(self.group.pk).posts_count, 1)
+        Post.objects.filter(pk=post.pk).delete()
+        with self.assertRaises(Post.DoesNotExist):
+            Post.cached.get(post.pk)
+
+    def test_invalidation_reaches_other_hosts(self):
+        '''Сохранение на одном хосте сбрасывает строку и на другом'''
+        with override_settings(OBJECT_CACHE='other_host'):
+            Post.cached.get(self.post.pk)
+        post = Post.cached.get(self.post.pk)
+        post.text = 'Новый текст'
+        post.save()
+        with override_settings(OBJECT_CACHE='other_host'):
+            self.assertEqual(Post.cached.get(post.pk).text, 'Новый текст')
+
+
+class SharedMemoryObjectCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_long_post_cached(self):
+        '''Строка длинного поста помещается в ячейку кэша объектов'''
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(text='Длинный текст ' * 250, author=author)
+        Post.cached.get(post.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(Post.cached.get(post.pk).text, post.text)
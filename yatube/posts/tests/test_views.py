@@ -1,14 +1,31 @@
+import io
+import json
 import shutil
 import tempfile
+from datetime import timedelta
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
-
-from posts.models import Post, Group, Comment, User, Follow
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image
+from sorl.thumbnail import default
+
+from core.cache import get_version
+from posts.autocomplete import (VERSION_KEY, PrefixIndex, change_key,
+                                invalidate)
+from posts.feed_cache import FEED_IDS_VERSION_KEY
+from posts.management.commands.explain_feeds import is_bounded
+from posts.models import Post, Group, Comment, User, Follow, FeedItem
+from posts.pagination import after_position, before_position
+from posts.image_variants import generate_image_variants
+from posts.thumbnails import pregenerate_thumbnails
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -216,6 +233,82 @@ class PostsPagesTests(TestCase):
                 response = self.guest_client.get(reverse_name + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), pages)
 
+    def test_cursor_paginator(self):
+        '''Курсорная паджинация идет по токенам вперед и назад'''
+        posts_per_page = {
+            reverse('posts:index'): 4,
+            reverse('posts:group_list',
+                    kwargs={'slug': 'second_group'}): 3,
+            reverse('posts:profile',
+                    kwargs={'username': 'shlomo'}): 2,
+        }
+        for reverse_name, pages in posts_per_page.items():
+            with self.subTest(reverse_name=reverse_name):
+                first_page = self.guest_client.get(
+                    reverse_name).context['page_obj']
+                self.assertIsNone(first_page.previous_cursor)
+                response = self.guest_client.get(
+                    reverse_name, {'after': first_page.next_cursor})
+                second_page = response.context['page_obj']
+                self.assertEqual(len(second_page), pages)
+                self.assertIsNone(second_page.next_cursor)
+                # Первая и вторая страницы не пересекаются
+                self.assertFalse(
+                    set(first_page.object_list)
+                    & set(second_page.object_list)
+                )
+                response = self.guest_client.get(
+                    reverse_name, {'before': second_page.previous_cursor})
+                self.assertEqual(
+                    response.context['page_obj'].object_list,
+                    first_page.object_list
+                )
+
+    def test_broken_cursor_shows_first_page(self):
+        '''Битый токен отдает первую страницу'''
+        response = self.guest_client.get(
+            reverse('posts:index'), {'after': 'broken'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertIsNone(response.context['page_obj'].previous_cursor)
+
+    def test_cursor_uses_index_range(self):
+        '''Страница по курсору начинает проход по индексу с позиции'''
+        post = Post.objects.first()
+        position = (post.created, post.pk)
+        querysets = [
+            after_position(Post.objects.order_by('-created', '-pk'),
+                           position),
+            before_position(Post.objects.order_by('created', 'pk'),
+                            position),
+            after_position(Post.objects.filter(
+                author=post.author).order_by('-created', '-pk'), position),
+        ]
+        for queryset in querysets:
+            with self.subTest(query=str(queryset.query)):
+                self.assertTrue(is_bounded(queryset[:11].explain()))
+
+    def test_feed_pages_constant_queries(self):
+        '''Число запросов страницы не зависит от числа постов на ней'''
+        # Страницы без картинок: миниатюры проверяет ThumbnailTests.
+        # Группа, автор, списки id, посты, счетчики и время
+        # последнего комментария после первого запроса берутся
+        # из кэша; у поста остаются сами комментарии.
+        post = Post.objects.filter(author=self.second_user).first()
+        pages = {
+            reverse('posts:group_list',
+                    kwargs={'slug': 'second_group'}): 0,
+            reverse('posts:profile',
+                    kwargs={'username': 'shlomo'}): 0,
+            reverse('posts:post_detail',
+                    kwargs={'post_id': post.pk}): 1,
+        }
+        for page, queries in pages.items():
+            with self.subTest(page=page):
+                self.guest_client.get(page)
+                with self.assertNumQueries(queries):
+                    self.guest_client.get(page)
+
     def test_adding_post(self):
         '''Проверяем, что пост добавляется на нужные страницы'''
         test_post = Post.objects.create(
@@ -272,6 +365,7 @@ class PostsPagesTests(TestCase):
             ).exists()
         )
 
+    @override_settings(THUMBNAIL_ASYNC=False)
     def test_following_page_new_post_from_follower(self):
         '''Появляется ли новый пост избранного автора в нашей ленте'''
         third_user = User.objects.create_user('third')
@@ -300,6 +394,96 @@ class PostsPagesTests(TestCase):
             len(response.context['page_obj']), 0
         )
 
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_following_page_backfill_and_unfollow(self):
+        '''Старые посты автора появляются после подписки и уходят после
+        отписки'''
+        reader = User.objects.create_user('reader')
+        reader_client = Client()
+        reader_client.force_login(reader)
+        reader_client.get(
+            reverse('posts:profile_follow', args=(self.second_user.username,))
+        )
+        response = reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertTrue(all(
+            post.author == self.second_user
+            for post in response.context['page_obj']
+        ))
+        reader_client.get(
+            reverse('posts:profile_unfollow',
+                    args=(self.second_user.username,))
+        )
+        response = reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+        self.assertFalse(FeedItem.objects.filter(user=reader).exists())
+
+
+@override_settings(THUMBNAIL_ASYNC=False, FEED_FAN_OUT_LIMIT=2)
+class FanOutTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='star')
+        cls.readers = [
+            User.objects.create_user(username=f'reader{i}')
+            for i in range(3)
+        ]
+        cls.old_post = Post.objects.create(
+            text='Старый пост', author=cls.author)
+        for reader in cls.readers:
+            Follow.objects.create(user=reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(FanOutTests.readers[0])
+
+    def test_fan_in_author_not_fanned_out(self):
+        '''Пост автора с множеством подписчиков не рассылается,
+        но виден в ленте подписок'''
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [post, self.old_post]
+        )
+        response = self.client.get(reverse('api:v1:follow_index'))
+        ids = [item['id'] for item in json.loads(
+            b''.join(response.streaming_content)
+        )['results']]
+        self.assertEqual(ids, [post.pk, self.old_post.pk])
+
+    @override_settings(FEED_FAN_OUT_LIMIT=3, FEED_FAN_OUT_BATCH=1)
+    def test_fan_out_in_batches(self):
+        '''Рассылка идет пачками и доходит до всех подписчиков'''
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(FeedItem.objects.filter(post=post).count(), 3)
+
+    def test_fan_out_after_commit(self):
+        '''В фоновом режиме рассылка ждет коммита транзакции'''
+        with override_settings(THUMBNAIL_ASYNC=True, FEED_FAN_OUT_LIMIT=3):
+            post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+
+    def test_unfollow_ends_fan_in(self):
+        '''Автор опустился до предела: его посты раскладываются'''
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        Follow.objects.get(user=self.readers[2]).delete()
+        self.assertEqual(FeedItem.objects.filter(post=post).count(), 2)
+
+    @override_settings(FEED_FAN_OUT_LIMIT=10, FEED_BACKFILL_LIMIT=1)
+    def test_backfill_limited(self):
+        '''Новый подписчик получает не больше FEED_BACKFILL_LIMIT постов'''
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        reader = User.objects.create_user(username='late')
+        Follow.objects.create(user=reader, author=self.author)
+        self.assertEqual(
+            list(FeedItem.objects.filter(user=reader).values_list(
+                'post_id', flat=True)),
+            [post.pk]
+        )
+
 
 class CacheTests(TestCase):
     @classmethod
@@ -311,16 +495,450 @@ class CacheTests(TestCase):
             text='Test cache page',
             author=cls.user)
 
+    def setUp(self):
+        cache.clear()
+
     def test_index_page_is_cached(self):
         '''Проверяем кэшируется ли главная страница'''
         initial_response = CacheTests.guest.get(reverse('posts:index'))
-        CacheTests.post.delete()
+        # update() не шлет сигналов, версия кэша не меняется
+        Post.objects.filter(pk=CacheTests.post.pk).update(
+            text='Changed without signals')
         second_response = CacheTests.guest.get(reverse('posts:index'))
+        self.assertEqual(
+            initial_response.context['page_obj'].object_list[0].pk,
+            second_response.context['page_obj'].object_list[0].pk,
+            'Страница не была закэширована'
+        )
+        with self.assertNumQueries(0):
+            # Из кэша берется список id, посты вместе с авторами -
+            # из кэша объектов
+            CacheTests.guest.get(reverse('posts:index'))
+
+    def test_extra_params_share_cache(self):
+        '''Лишние параметры и битый курсор не создают новых ключей'''
+        CacheTests.guest.get(reverse('posts:index'))
+        CacheTests.guest.get(reverse('posts:index'), {'page': 1})
+        for query in ({'utm_source': 'mail'}, {'after': 'broken'},
+                      {'page': 'x', 'utm_source': 'mail'}):
+            with self.subTest(query=query):
+                with self.assertNumQueries(0):
+                    CacheTests.guest.get(reverse('posts:index'), query)
+
+    def test_edited_post_keeps_feed_ids(self):
+        '''Правка поста обновляет его строку, а не списки id лент'''
+        CacheTests.guest.get(reverse('posts:index'))
+        version = cache.get(FEED_IDS_VERSION_KEY)
+        post = Post.objects.get(pk=CacheTests.post.pk)
+        post.text = 'Edited post'
+        post.save()
+        response = CacheTests.guest.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'][0].text, 'Edited post')
+        self.assertEqual(cache.get(FEED_IDS_VERSION_KEY), version)
+
+    def test_index_cache_invalidated_by_signals(self):
+        '''Новый и удаленный пост сразу видны на главной'''
+        CacheTests.guest.get(reverse('posts:index'))
+        new_post = Post.objects.create(
+            text='Fresh post',
+            author=CacheTests.user)
+        response = CacheTests.guest.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+        new_post.delete()
+        response = CacheTests.guest.get(reverse('posts:index'))
+        self.assertNotIn(new_post, response.context['page_obj'])
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest = Client()
+        cls.user = User.objects.create_user(username='conditional')
+        cls.post = Post.objects.create(
+            text='Conditional GET',
+            author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified_without_queries(self):
+        '''Совпавший ETag дает 304 без запросов к базе'''
+        for url in (reverse('posts:index'), reverse(
+                'posts:post_detail', args=(ConditionalGetTests.post.pk,))):
+            with self.subTest(url=url):
+                etag = ConditionalGetTests.guest.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = ConditionalGetTests.guest.get(
+                        url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_new_post_changes_etag(self):
+        '''Новый пост меняет ETag ленты и группы'''
+        group = Group.objects.create(
+            title='Группа', slug='conditional', description='Описание')
+        for url in (reverse('posts:index'),
+                    reverse('posts:group_list', args=('conditional',))):
+            with self.subTest(url=url):
+                etag = ConditionalGetTests.guest.get(url)['ETag']
+                Post.objects.create(
+                    text='Новый', author=ConditionalGetTests.user,
+                    group=group)
+                response = ConditionalGetTests.guest.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_profile_etag_follows_subscription(self):
+        '''Подписка на автора меняет ETag его профиля'''
+        follower = User.objects.create_user(username='follower')
+        client = Client()
+        client.force_login(follower)
+        url = reverse('posts:profile', args=('conditional',))
+        etag = client.get(url)['ETag']
+        self.assertEqual(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        client.get(reverse('posts:profile_follow', args=('conditional',)))
+        self.assertEqual(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_author_and_group_change_etag(self):
+        '''Правка имени автора или группы меняет ETag ленты'''
+        group = Group.objects.create(
+            title='Группа', slug='conditional', description='Описание')
+        url = reverse('posts:index')
+        for obj, field in ((ConditionalGetTests.user, 'first_name'),
+                           (group, 'title')):
+            with self.subTest(field=field):
+                etag = ConditionalGetTests.guest.get(url)['ETag']
+                setattr(obj, field, 'Новое имя')
+                obj.save()
+                response = ConditionalGetTests.guest.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_login_keeps_etag(self):
+        '''Вход пользователя (только last_login) ETag не меняет'''
+        url = reverse('posts:index')
+        etag = ConditionalGetTests.guest.get(url)['ETag']
+        Client().force_login(ConditionalGetTests.user)
+        response = ConditionalGetTests.guest.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_last_modified_follows_comments(self):
+        '''Last-Modified поста сдвигается новым комментарием'''
+        url = reverse('posts:post_detail', args=(ConditionalGetTests.post.pk,))
+        last_modified = ConditionalGetTests.guest.get(url)['Last-Modified']
+        response = ConditionalGetTests.guest.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        comment = Comment.objects.create(
+            post=ConditionalGetTests.post,
+            author=ConditionalGetTests.user,
+            text='Комментарий')
+        Comment.objects.filter(pk=comment.pk).update(
+            created=comment.created + timedelta(minutes=1))
+        response = ConditionalGetTests.guest.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest = Client()
+        cls.user = User.objects.create_user(username='thumbnails')
+        cls.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=cls.user,
+            image=SimpleUploadedFile(
+                name='thumbnail.gif',
+                content=(
+                    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+                    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+                    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+                    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+                    b'\x02\x4c\x01\x00\x3b'
+                ),
+                content_type='image/gif'
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_page_does_not_generate_thumbnail(self):
+        '''Страница не создает миниатюру сама, а выводит заглушку'''
+        with mock.patch.object(default.engine, 'get_image') as get_image:
+            response = ThumbnailTests.guest.get(
+                reverse('posts:post_detail', args=(ThumbnailTests.post.pk,))
+            )
+        get_image.assert_not_called()
+        self.assertNotContains(response, '<img class="card-img')
+        self.assertContains(response, 'bg-light')
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_pregenerated_thumbnail_is_shown(self):
+        '''Созданная заранее миниатюра выводится на странице'''
+        pregenerate_thumbnails(ThumbnailTests.post.image)
+        response = ThumbnailTests.guest.get(
+            reverse('posts:post_detail', args=(ThumbnailTests.post.pk,))
+        )
+        self.assertContains(response, '<img class="card-img')
+
+    def test_thumbnails_prefetched_in_one_query(self):
+        '''Записи миниатюр страницы загружаются одним запросом'''
+        Post.objects.bulk_create([
+            Post(text=f'Пост {i}', author=ThumbnailTests.user,
+                 image=f'posts/missing_{i}.jpg')
+            for i in range(5)
+        ])
+        default.kvstore._local.clear()
+        # Id ленты, строки постов и авторов для кэша объектов
+        # и одна пакетная загрузка KV-хранилища
+        with self.assertNumQueries(4):
+            ThumbnailTests.guest.get(reverse('posts:index'))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_ASYNC=False)
+class ImageVariantsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest = Client()
+        cls.user = User.objects.create_user(username='variants')
+        cls.author_client = Client()
+        cls.author_client.force_login(cls.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def upload(self):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera'
+        Image.new('RGB', (1000, 500), 'red').save(
+            buffer, 'JPEG', exif=exif.tobytes()
+        )
+        return SimpleUploadedFile(
+            name='variants.jpg',
+            content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+
+    def test_variants_created_on_upload(self):
+        '''После загрузки создаются варианты и выводится <picture>'''
+        ImageVariantsTests.author_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с вариантами', 'image': self.upload()},
+            follow=True
+        )
+        post = Post.objects.get(text='Пост с вариантами')
+        picture = post.picture
+        self.assertIn('image/webp', [s['type'] for s in picture['sources']])
+        # 1440 шире оригинала и не создается
+        self.assertIn('480w', picture['srcset'])
+        self.assertIn('960w', picture['srcset'])
+        self.assertNotIn('1440w', picture['srcset'])
+        response = ImageVariantsTests.guest.get(
+            reverse('posts:post_detail', args=(post.pk,))
+        )
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, 'type="image/webp"')
+
+    def test_variants_have_no_metadata(self):
+        '''Варианты сохраняются без EXIF и в пропорциях карточки'''
+        post = Post.objects.create(
+            text='Пост', author=ImageVariantsTests.user, image=self.upload()
+        )
+        generate_image_variants(Post, post.pk)
+        post.refresh_from_db()
+        for files in json.loads(post.image_variants)['formats'].values():
+            for width, name in files:
+                with default_storage.open(name) as file_:
+                    image = Image.open(file_)
+                    self.assertNotIn('exif', image.info)
+                    height = round(width * 339 / 960)
+                    self.assertEqual(image.size, (width, height))
+
+    def test_stale_variants_are_ignored(self):
+        '''Варианты прежней картинки не выводятся'''
+        post = Post.objects.create(
+            text='Пост', author=ImageVariantsTests.user, image=self.upload()
+        )
+        generate_image_variants(Post, post.pk)
+        post.refresh_from_db()
+        post.image = 'posts/other.jpg'
+        self.assertEqual(post.picture, {})
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest = Client()
+        cls.user = User.objects.create_user(username='search')
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        cls.match = Post.objects.create(
+            text='Рецепт борща <b>без</b> свеклы', author=cls.user)
+        cls.other = Post.objects.create(
+            text='Про котиков', author=cls.user)
+
+    def test_search_finds_and_highlights(self):
+        '''Поиск находит пост и подсвечивает совпадение'''
+        response = SearchTests.guest.get(
+            reverse('posts:search'), {'q': 'борща'})
+        self.assertEqual(
+            list(response.context['page_obj']), [SearchTests.match])
+        self.assertContains(response, '<mark>борща</mark>')
+        # Текст поста экранирован
+        self.assertContains(response, '&lt;b&gt;без&lt;/b&gt;')
+
+    def test_search_index_follows_edits(self):
+        '''Индекс обновляется при изменении и удалении поста'''
+        url = reverse('posts:search')
+        SearchTests.other.text = 'Про котиков и борща'
+        SearchTests.other.save()
+        response = SearchTests.guest.get(url, {'q': 'котиков'})
+        self.assertEqual(
+            list(response.context['page_obj']), [SearchTests.other])
+        SearchTests.other.delete()
+        response = SearchTests.guest.get(url, {'q': 'котиков'})
+        self.assertEqual(list(response.context['page_obj']), [])
+
+    def test_search_pages(self):
+        '''Результаты делятся на страницы без подсчета всех совпадений'''
+        Post.objects.bulk_create([
+            Post(text=f'Суп номер {i}', author=SearchTests.user)
+            for i in range(settings.PAGES_NUMBER + 3)
+        ])
+        url = reverse('posts:search')
+        response = SearchTests.guest.get(url, {'q': 'суп'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), settings.PAGES_NUMBER)
+        self.assertTrue(page_obj.has_next())
+        response = SearchTests.guest.get(url, {'q': 'суп', 'page': 2})
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+    @override_settings(SEARCH_MAX_PAGES=1)
+    def test_search_page_number_clamped(self):
+        '''Дальние страницы поиска отдают последнюю разрешенную'''
+        Post.objects.bulk_create([
+            Post(text=f'Суп номер {i}', author=SearchTests.user)
+            for i in range(settings.PAGES_NUMBER + 3)
+        ])
+        response = SearchTests.guest.get(
+            reverse('posts:search'), {'q': 'суп', 'page': 10 ** 9})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 1)
+        self.assertEqual(len(page_obj), settings.PAGES_NUMBER)
+        self.assertFalse(page_obj.has_next())
+
+    def test_query_syntax_is_not_interpreted(self):
+        '''Операторы FTS5 в запросе не ломают поиск'''
+        response = SearchTests.guest.get(
+            reverse('posts:search'), {'q': '"борща OR NEAR(('})
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_search_uses_index(self):
+        '''Поиск в админке идет по полнотекстовому индексу'''
+        client = Client()
+        client.force_login(SearchTests.admin)
+        response = client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'свеклы'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [SearchTests.match])
+
+
+# Индекс подсказок меняется после коммита: нужны настоящие транзакции
+class AutocompleteTests(TransactionTestCase):
+    def setUp(self):
         cache.clear()
-        third_response = CacheTests.guest.get(reverse('posts:index'))
-        self.assertEqual(initial_response.content,
-                         second_response.content,
-                         'Страница не была закэширована')
-        self.assertNotEqual(initial_response.content,
-                            third_response.content,
-                            'Кэш не отчистился')
+        self.guest = Client()
+        self.user = User.objects.create_user(username='Leo')
+        self.group = Group.objects.create(
+            title='Лето в деревне', slug='leto', description='Описание')
+
+    def lookup(self, query, kind=None):
+        params = {'q': query}
+        if kind:
+            params['type'] = kind
+        response = self.guest.get(
+            reverse('posts:autocomplete'), params)
+        return [item['label'] for item in response.json()['results']]
+
+    def test_prefix_lookup(self):
+        '''Подсказки ищутся по началу имени, названия и slug'''
+        self.assertEqual(self.lookup('le', 'user'), ['Leo'])
+        self.assertEqual(self.lookup('лет'), ['Лето в деревне'])
+        self.assertEqual(self.lookup('leto'), ['Лето в деревне'])
+        self.assertEqual(self.lookup('x'), [])
+
+    def test_index_refreshed_on_save(self):
+        '''Новые и удаленные объекты сразу видны в подсказках'''
+        self.lookup('le')
+        user = User.objects.create_user(username='leonid')
+        self.assertEqual(self.lookup('leon'), ['leonid'])
+        user.username = 'misha'
+        user.save()
+        self.assertEqual(self.lookup('leon'), [])
+        user.delete()
+        self.assertEqual(self.lookup('mis'), [])
+
+    def test_rolled_back_user_not_indexed(self):
+        '''Пользователь из откаченной транзакции не попадает в подсказки'''
+        self.lookup('le')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            User.objects.create_user(username='leonid')
+            raise RuntimeError
+        self.assertEqual(self.lookup('leon'), [])
+
+    def test_lookup_without_queries(self):
+        '''Построенный индекс отвечает без запросов к базе'''
+        self.lookup('le')
+        with self.assertNumQueries(0):
+            self.lookup('lea')
+
+    def test_other_worker_applies_change_log(self):
+        '''Другой процесс догоняет изменения по журналу без перестройки'''
+        worker = PrefixIndex()
+        worker.search('le')
+        User.objects.create_user(username='leonid')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [item['label'] for item in worker.search('leon')],
+                ['leonid'])
+
+    def test_other_worker_rebuilds_without_log(self):
+        '''Без записи журнала или после invalidate индекс строится заново'''
+        worker = PrefixIndex()
+        worker.search('le')
+        User.objects.create_user(username='leonid')
+        cache.delete(change_key(get_version(VERSION_KEY)))
+        User.objects.create_user(username='leopold')
+        with mock.patch.object(
+                worker, '_load', wraps=worker._load) as load:
+            self.assertEqual(len(worker.search('leo')), 3)
+            invalidate()
+            worker.search('leo')
+        self.assertEqual(load.call_count, 2)
+
+    def test_create_form_does_not_list_groups(self):
+        '''Форма поста не выводит все группы списком'''
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(reverse('posts:post_create'))
+        self.assertNotContains(response, '<option')
+        self.assertContains(response, 'data-autocomplete-url')
@@ -0,0 +1,155 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend as BaseThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from core.query_budget import outside_budget
+from core.stampede import single_flight
+
+from .feed_cache import bump_feed_version
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.THUMBNAIL_WORKERS,
+    thread_name_prefix='thumbnails'
+)
+# Миниатюры, которые уже стоят в очереди: горячая страница
+# не должна ставить одну и ту же работу много раз.
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который не работает с PIL в запросе.
+
+    ``{% thumbnail %}`` получает только готовую миниатюру из KV-хранилища.
+    Если ее нет, генерация ставится в фоновую очередь, а тег выводит
+    блок ``{% empty %}`` с заглушкой.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        thumbnail = self.get_cached_thumbnail(
+            file_, geometry_string, **options
+        )
+        if thumbnail is None:
+            enqueue_thumbnail(file_, geometry_string, options)
+        return thumbnail
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        return default.kvstore.get(
+            self.get_thumbnail_file(file_, geometry_string, options)
+        )
+
+    def get_thumbnail_file(self, file_, geometry_string, options):
+        """ImageFile миниатюры без обращения к картинке и хранилищу."""
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source = ImageFile(file_)
+        options = dict(options)
+        self._prepare_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def generate_thumbnail(self, file_, geometry_string, **options):
+        """Создает миниатюру штатным путем sorl-thumbnail."""
+        return super().get_thumbnail(file_, geometry_string, **options)
+
+    def _prepare_options(self, source, options):
+        # Та же подстановка настроек по умолчанию, что в
+        # BaseThumbnailBackend.get_thumbnail: от нее зависит имя файла.
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+
+
+def _run(key, func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась ошибкой', key)
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+        close_old_connections()
+
+
+def run_in_background(key, func, *args):
+    """Выполняет ``func(*args)`` в фоновом потоке после коммита транзакции.
+
+    Задача с тем же ключом, пока она стоит в очереди, второй раз
+    не ставится. При ``THUMBNAIL_ASYNC = False`` выполняется сразу.
+    """
+    if not settings.THUMBNAIL_ASYNC:
+        # Обычно это работа фонового потока: в бюджет страницы не идет
+        with outside_budget():
+            func(*args)
+        return
+
+    def submit():
+        with _pending_lock:
+            if key in _pending:
+                return
+            _pending.add(key)
+        executor.submit(_run, key, func, args)
+
+    transaction.on_commit(submit)
+
+
+def _generate(name, geometry_string, options):
+    key = f'thumbnail:{name}:{geometry_string}:{sorted(options.items())}'
+    # Очередь убирает повторы внутри процесса, блокировка в общем
+    # кэше - между воркерами: картинку режет кто-то один
+    with single_flight(key) as leader:
+        if not leader:
+            return
+        default.backend.generate_thumbnail(name, geometry_string, **options)
+    # Заглушка на страницах сменилась картинкой: сбрасываем ETag
+    bump_feed_version()
+
+
+def enqueue_thumbnail(file_, geometry_string, options):
+    """Ставит создание миниатюры в очередь после коммита транзакции."""
+    name = getattr(file_, 'name', file_)
+    options = dict(options)
+    key = (name, geometry_string, tuple(sorted(options.items())))
+    run_in_background(key, _generate, name, geometry_string, options)
+
+
+def pregenerate_thumbnails(image):
+    """Ставит в очередь миниатюры всех размеров из настроек."""
+    if not image:
+        return
+    for geometry_string, options in settings.THUMBNAIL_GEOMETRIES:
+        enqueue_thumbnail(image, geometry_string, options)
+
+
+def prefetch_thumbnails(posts):
+    """Одним пакетом загружает записи KV-хранилища для миниатюр страницы.
+
+    Вызывается до рендеринга шаблона, чтобы теги ``{% thumbnail %}``
+    находили записи в памяти процесса.
+    """
+    prefetch = getattr(default.kvstore, 'prefetch', None)
+    if prefetch is None:
+        return
+    prefetch([
+        add_prefix(default.backend.get_thumbnail_file(
+            post.image, geometry_string, options
+        ).key)
+        for post in posts if post.image
+        for geometry_string, options in settings.THUMBNAIL_GEOMETRIES
+    ])
@@ -12,6 +12,12 @@ urlpatterns = [
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/delete/', views.post_delete, name='post_delete'),
     path('create/', views.post_create, name='post_create'),
+    path('search/', views.search, name='search'),
+    path(
+        'autocomplete/',
+        views.autocomplete_lookup,
+        name='autocomplete'
+    ),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
@@ -1,22 +1,29 @@
-from django.core.paginator import Paginator
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
-from django.conf import settings
-from django.core.cache import cache
+from django.views.decorators.http import condition
 
+from . import autocomplete
+from .conditional import page_etag, post_last_modified, profile_etag
+from .counters import get_author_stats
+from .feed_cache import cached_page, hydrate
 from .forms import PostForm, CommentForm
-from .models import Comment, Follow, Group, Post, User
+from .image_variants import enqueue_image_variants
+from .inbox import fan_in_authors, follow_feed
+from .models import Comment, FeedItem, Follow, Group, Post, User
+from .pagination import paginate
+from .search import search_page
+from .thumbnails import prefetch_thumbnails, pregenerate_thumbnails
 
 
+@condition(etag_func=page_etag)
 def index(request):
-
-    post_list = cache.get_or_set('index_page', Post.objects.all(), 20)
-    # post_list = Post.objects.all()
-    paginator = Paginator(post_list, settings.PAGES_NUMBER)
-    # Из URL извлекаем номер запрошенной страницы - это значение параметра page
-    page_number = request.GET.get('page')
-    # Получаем набор записей для страницы с запрошенным номером
-    page_obj = paginator.get_page(page_number)
+    post_list = Post.objects.all()
+    # Страница выбирается по токенам after/before из URL
+    # или по старому параметру page; id постов берутся из кэша
+    page_obj = cached_page(request, 'index', post_list)
+    prefetch_thumbnails(page_obj)
     # Отдаем в словаре контекста
     context = {
         'page_obj': page_obj,
@@ -24,12 +31,14 @@ def index(request):
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=page_etag)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, settings.PAGES_NUMBER)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group = Group.cached.get_or_404(slug=slug)
+    # Не group.posts: менеджер связи проставляет группу каждому посту
+    # и дочитывает отложенный group_id по запросу на пост
+    post_list = Post.objects.filter(group=group)
+    page_obj = cached_page(request, f'group:{group.pk}', post_list)
+    prefetch_thumbnails(page_obj)
     template = 'posts/group_list.html'
     context = {
         'group': group,
@@ -38,33 +47,34 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@condition(etag_func=profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = User.cached.get_or_404(username=username)
     # Здесь код запроса к модели и создание словаря контекста
-    post_list = Post.objects.select_related(
-        'author'
-    ).filter(author=author)
-    paginator = Paginator(post_list, settings.PAGES_NUMBER)
+    post_list = Post.objects.filter(author=author)
     if request.user.is_authenticated:
         following = Follow.objects.filter(
             user=request.user, author=author).exists()
     else:
         following = False
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = cached_page(request, f'profile:{author.pk}', post_list)
+    prefetch_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
         'author': author,
+        'author_stats': get_author_stats(author.pk),
         'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=page_etag, last_modified_func=post_last_modified)
 def post_detail(request, post_id):
     # Здесь код запроса к модели и создание словаря контекста
-    post = get_object_or_404(Post, pk=post_id)
-    post_count = Post.objects.filter(author=post.author).count()
-    comments = Comment.objects.filter(post=post)
+    post = Post.cached.get_or_404(post_id, related=('author', 'group'))
+    prefetch_thumbnails([post])
+    post_count = get_author_stats(post.author_id).posts_count
+    comments = list(Comment.objects.for_thread().filter(post=post))
     form = CommentForm(request.POST or None)
     template = 'posts/post_detail.html'
     context = {
@@ -76,6 +86,33 @@ def post_detail(request, post_id):
     return render(request, template, context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        number = 1
+    page_obj = None
+    if query:
+        page_obj = search_page(
+            Post.objects.for_feed(), query, number, settings.PAGES_NUMBER
+        )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def autocomplete_lookup(request):
+    # Подсказки по началу имени пользователя, названия или slug группы
+    kind = request.GET.get('type')
+    if kind not in ('user', 'group'):
+        kind = None
+    results = autocomplete.search(request.GET.get('q', ''), kind)
+    return JsonResponse({'results': results})
+
+
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
@@ -94,6 +131,9 @@ def post_edit(request, post_id):
     }
     if request.method == 'POST' and form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            pregenerate_thumbnails(post.image)
+            enqueue_image_variants(post)
         return redirect('posts:post_detail', post.pk)
     return render(request, template, context)
 
@@ -101,11 +141,13 @@ def post_edit(request, post_id):
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
-    form = PostForm(request.POST or None)
+    form = PostForm(request.POST or None, files=request.FILES or None)
     if request.method == 'POST' and form.is_valid():
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        pregenerate_thumbnails(post.image)
+        enqueue_image_variants(post)
         return redirect('posts:profile', post.author)
     return render(request, template, {'form': form})
 
@@ -133,17 +175,24 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    # Тесты я.практикума не проходят :( )
-    # post_list = cache.get_or_set(
-    #     'following_page',
-    #     Post.objects.filter(author__following__user=request.user),
-    #     20
-    # )
-
-    post_list = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post_list, settings.PAGES_NUMBER)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Лента подписок читается из заранее разложенных записей FeedItem:
+    # один диапазон по индексу (user, created) вместо соединения с Follow.
+    # Посты авторов с огромным числом подписчиков не раскладываются:
+    # с ними лента собирается из постов (см. posts.inbox).
+    fan_in = fan_in_authors(request.user.pk)
+    if fan_in:
+        page_obj = paginate(
+            request, follow_feed(request.user.pk, fan_in).only('created')
+        )
+        post_ids = [post.pk for post in page_obj]
+    else:
+        item_list = FeedItem.objects.filter(
+            user=request.user
+        ).only('created', 'post')
+        page_obj = paginate(request, item_list)
+        post_ids = [item.post_id for item in page_obj]
+    page_obj.object_list = hydrate(Post, post_ids)
+    prefetch_thumbnails(page_obj)
     context = {
         'page_obj': page_obj,
     }
@@ -155,13 +204,13 @@ def profile_follow(request, username):
     if request.user.username == username:
         return redirect('posts:profile', username=username)
 
-    author = get_object_or_404(User, username=username)
+    author = User.cached.get_or_404(username=username)
     Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = User.cached.get_or_404(username=username)
     Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('posts:profile', username=username)
@@ -0,0 +1,43 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.urls import reverse_lazy
+
+
+class AutocompleteSelect(forms.Select):
+    """Выбор объекта через подсказки ``posts:autocomplete`` вместо <select>.
+
+    Варианты не выводятся на страницу: виджет рендерит скрытое поле
+    с pk и текстовое поле, которое запрашивает подсказки у сервера.
+    Из базы берется только название уже выбранного объекта.
+    Шаблон лежит в posts/templates: стандартный FORM_RENDERER
+    ищет шаблоны виджетов только в каталогах приложений.
+    """
+    template_name = 'posts/widgets/autocomplete.html'
+
+    def __init__(self, kind, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+
+    def get_context(self, name, value, attrs):
+        context = forms.Widget.get_context(self, name, value, attrs)
+        context['widget'].update({
+            'kind': self.kind,
+            'url': reverse_lazy('posts:autocomplete'),
+            'label': self.selected_label(value),
+        })
+        return context
+
+    def format_value(self, value):
+        return '' if value is None else str(value)
+
+    def selected_label(self, value):
+        if value in (None, ''):
+            return ''
+        iterator = self.choices
+        # Значение приходит из POST как есть: мусор - не ошибка сервера.
+        # to_python поля сам проверяет pk и достает объект.
+        try:
+            obj = iterator.field.to_python(value)
+        except (ValidationError, ValueError, TypeError):
+            return ''
+        return iterator.field.label_from_instance(obj) if obj else ''
@@ -12,7 +12,10 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 import sentry_sdk
 from sentry_sdk.integrations.django import DjangoIntegration
 
+import atexit
 import os
+import shutil
+import tempfile
 from dotenv import load_dotenv
 
 
@@ -22,6 +25,10 @@ load_dotenv()
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Тестовый режим: его включают настройки yatube.test_settings,
+# которые берут manage.py test и pytest
+TESTING = os.getenv('DJANGO_TESTING') == '1'
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
@@ -58,11 +65,13 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
     'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'core.server_timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,6 +80,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -161,6 +171,94 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 PAGES_NUMBER = 10
+# Сколько страниц результатов поиска можно пролистать: дальние
+# страницы OFFSET заставляют ранжировать и пропускать все совпадения
+SEARCH_MAX_PAGES = 20
+# Наибольший размер страницы JSON API (параметр limit)
+API_MAX_LIMIT = 100
+# Сколько комментариев встраивается в пост JSON API; остальные
+# читаются постранично по ссылке comments_next
+API_COMMENTS_LIMIT = 10
+
+# Допустимое число SQL-запросов на страницу. Превышение пишется
+# в лог core.query_budget, в тестах (QUERY_BUDGET_RAISE) - ошибка.
+# Бюджеты лент рассчитаны на пустой кэш объектов: авторы и группы
+# тогда поднимаются отдельными запросами. Лента подписок тратит
+# запрос на авторов, чьи посты не рассылаются (FEED_FAN_OUT_LIMIT).
+QUERY_BUDGETS = {
+    'posts:index': 6,
+    'posts:group_list': 7,
+    'posts:profile': 11,
+    'posts:post_detail': 8,
+    'posts:search': 4,
+    'posts:autocomplete': 3,
+    'posts:post_edit': 10,
+    'posts:post_create': 15,
+    'posts:post_delete': 15,
+    'posts:add_comment': 10,
+    'posts:follow_index': 6,
+    'posts:profile_follow': 22,
+    'posts:profile_unfollow': 20,
+    'users:signup': 4,
+    'users:login': 4,
+    'users:logout': 4,
+    'users:password_reset_form': 4,
+    'api:v1:index': 1,
+    'api:v1:group_list': 2,
+    'api:v1:profile': 2,
+    'api:v1:follow_index': 5,
+    'api:v1:post_detail': 2,
+    'api:v1:post_comments': 2,
+}
+QUERY_BUDGET_RAISE = TESTING
+
+# Заголовок Server-Timing с разбивкой времени запроса по фазам:
+# раскрывает посторонним устройство сайта, поэтому только в DEBUG.
+# Строка в лог core.server_timing пишется независимо от него.
+SERVER_TIMING_HEADER = DEBUG
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # Строка JSON на каждый запрос; в тестах она только шумит
+        'core.server_timing': {
+            'handlers': ['console'],
+            'level': 'WARNING' if TESTING else 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+# Лента подписок: новый пост раскладывается по лентам подписчиков
+# (FeedItem) в фоне после коммита, пачками по FEED_FAN_OUT_BATCH строк.
+# Посты авторов, у которых подписчиков больше FEED_FAN_OUT_LIMIT, не
+# раскладываются: лента добирает их при чтении. Новый подписчик
+# получает в ленту не больше FEED_BACKFILL_LIMIT последних постов.
+FEED_FAN_OUT_LIMIT = 10000
+FEED_FAN_OUT_BATCH = 1000
+FEED_BACKFILL_LIMIT = 1000
+
+# Срок ключей версий (core.cache.get_version): лент, счетчиков,
+# каждого объекта в кэше объектов. Истекшая версия заводится заново
+# от времени, так что срок влияет только на число промахов.
+CACHE_VERSION_TIMEOUT = 24 * 60 * 60
+
+# Время жизни страниц лент в кэше. Устаревание отслеживается версией,
+# которую сбрасывают сигналы, так что время можно держать большим.
+FEED_CACHE_TIMEOUT = 60 * 60
+# Счетчики автора в кэше: сдвиг счетчика удаляет ключ сразу
+COUNTER_CACHE_TIMEOUT = 5 * 60
+# Кэш строк постов, групп и пользователей (posts.object_cache).
+# Общая память хоста: строки у каждого хоста свои, а версии объектов,
+# которые сдвигают сигналы, лежат в общем кэше по умолчанию.
+OBJECT_CACHE = 'shm'
+OBJECT_CACHE_TIMEOUT = 60 * 60
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
@@ -168,10 +266,88 @@ PAGES_NUMBER = 10
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# sorl-thumbnail: в запросе берутся только готовые миниатюры,
+# остальные создаются в фоновых потоках (см. posts.thumbnails).
+THUMBNAIL_BACKEND = 'posts.thumbnails.ThumbnailBackend'
+# KV-хранилище с LRU в памяти процесса и пакетной загрузкой страницы
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+THUMBNAIL_LRU_SIZE = 10000
+THUMBNAIL_LRU_MISS_TIMEOUT = 10
+# Фоновая очередь миниатюр, вариантов картинок и рассылки постов по
+# лентам подписок; False — сразу в запросе
+THUMBNAIL_ASYNC = True
+THUMBNAIL_WORKERS = 2
+# Размеры, которые создаются сразу после загрузки картинки.
+# Должны совпадать с параметрами тега в posts/includes/post_image.html.
+THUMBNAIL_GEOMETRIES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+# Адаптивные варианты картинок поста для <picture> и srcset
+# (см. posts.image_variants): пропорции, ширины и качество сжатия.
+IMAGE_VARIANT_SIZE = (960, 339)
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
+IMAGE_VARIANT_QUALITY = 80
+
+# Каталог файловых кэшей. Не общий /tmp: кэши распаковывают pickle,
+# и каталог, заранее созданный другим пользователем, дал бы ему
+# выполнение кода в воркере (бэкенды проверяют владельца и права).
+# Тесты получают свой каталог на процесс и не смотрят на CACHE_*
+# из окружения: иначе они делят кэш с локальным сервером и с
+# соседними прогонами.
+if TESTING:
+    CACHE_DIR = tempfile.mkdtemp(prefix='yatube_test_')
+    atexit.register(shutil.rmtree, CACHE_DIR, True)
+else:
+    CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+
+
+def cache_env(name, default):
+    return default if TESTING else os.getenv(name, default)
+
+
+# Кэш по умолчанию - LRU в памяти воркера перед общим кэшем 'shared'.
+# Локально общий уровень - файлы, в бою - сетевой кэш через
+# CACHE_BACKEND и CACHE_LOCATION (например, memcached).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TwoLevelCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            # Сколько секунд воркер доверяет своей копии
+            'LOCAL_TIMEOUT': 5,
+            # Версии ключей и счетчики: сдвиг в другом воркере
+            # виден не позже чем через столько секунд
+            'VERSION_LOCAL_TIMEOUT': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': cache_env(
+            'CACHE_BACKEND',
+            'core.cache.PrivateFileBasedCache'
+        ),
+        'LOCATION': cache_env(
+            'CACHE_LOCATION', os.path.join(CACHE_DIR, 'yatube_cache')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Общая память воркеров одного хоста для мелких данных, которые
+    # читают часто, а меняют редко. Размер файла - SLOTS * SLOT_SIZE.
+    # В ячейку помещается строка поста примерно до 4000 символов
+    # кириллицы; более длинные посты читаются из базы.
+    'shm': {
+        'BACKEND': 'core.mmap_cache.MmapCache',
+        'LOCATION': cache_env(
+            'SHM_CACHE_LOCATION', os.path.join(CACHE_DIR, 'yatube_shm.cache')
+        ),
+        'OPTIONS': {
+            'SLOTS': 4096,
+            'SLOT_SIZE': 8192,
+        },
+    },
 }
 
 sentry_sdk.init(
@@ -0,0 +1,10 @@
+"""Настройки для тестов.
+
+Их берут ``manage.py test`` и pytest (pytest.ini). Тестовый режим
+задан явно, а не угадывается по аргументам и загруженным модулям.
+"""
+import os
+
+os.environ['DJANGO_TESTING'] = '1'
+
+from .settings import *  # noqa: E402,F401,F403